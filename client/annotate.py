@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Annotates a directory of images with detections from the object detection service
+Images are uploaded in parallel over one pooled connection and saved with their
+boxes and labels drawn, plus a JSONL file with the raw detections
+"""
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+import cv2
+import numpy as np
+from dotenv import load_dotenv
+
+from detect_client import DetectClient
+
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png")
+
+
+def draw_detections(image_bytes: bytes, result: dict) -> np.ndarray:
+    image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+    for item in result.get("objects", []):
+        x1, y1, x2, y2 = (int(v) for v in item["coordinates"])
+        label = f"{item['class']} {item['confidence']:.2f}"
+        cv2.rectangle(image, (x1, y1), (x2, y2), (0, 0, 255), 2)
+        cv2.putText(image, label, (x1, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 2)
+    return image
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Annotate a directory of images with detected objects')
+    parser.add_argument('input_dir', type=str, help='Directory of JPEG/PNG images (searched recursively)')
+    parser.add_argument('output_dir', type=str, help='Where annotated images and detections.jsonl are written')
+    parser.add_argument('--url', type=str, default=None, help='Service URL, defaults to DETECT_API_URL')
+    parser.add_argument('--api-key', type=str, default=None, help='API key, defaults to DETECT_API_KEY')
+    parser.add_argument('--concurrency', type=int, default=16, help='Requests in flight at once')
+    parser.add_argument('--retries', type=int, default=3, help='Retries per image on overload or network errors')
+    parser.add_argument('--tile-size', type=int, default=None, help='Use tiled inference with this tile size')
+    parser.add_argument('--cache-dir', type=str, default=None, help='Reuse results for images already annotated')
+    return parser.parse_args()
+
+
+def main():
+    load_dotenv()
+    args = parse_arguments()
+    url = args.url or os.getenv("DETECT_API_URL")
+    if not url:
+        raise ValueError("Pass --url or set DETECT_API_URL")
+    api_key = args.api_key or os.getenv("DETECT_API_KEY")
+
+    input_dir, output_dir = Path(args.input_dir), Path(args.output_dir)
+    files = sorted(p for p in input_dir.rglob("*") if p.suffix.lower() in IMAGE_SUFFIXES)
+    if not files:
+        print(f"❌ No images found in {input_dir}")
+        return
+    output_dir.mkdir(parents=True, exist_ok=True)
+    print(f"📁 Annotating {len(files)} images from {input_dir}")
+
+    params = {"tile_size": args.tile_size} if args.tile_size else {}
+
+    def annotate(file: Path) -> dict:
+        # Upload, draw and save all happen on the worker thread, cv2 releases the GIL
+        relative = file.relative_to(input_dir)
+        image_bytes = file.read_bytes()
+        result = client.detect(image_bytes, **params)
+        target = output_dir / relative
+        target.parent.mkdir(parents=True, exist_ok=True)
+        cv2.imwrite(str(target), draw_detections(image_bytes, result))
+        return {"image": str(relative), **result}
+
+    start = time.perf_counter()
+    failed = 0
+    with DetectClient(url, api_key=api_key, retries=args.retries, max_connections=args.concurrency,
+                      cache_dir=args.cache_dir) as client, \
+            ThreadPoolExecutor(max_workers=args.concurrency) as executor, \
+            open(output_dir / "detections.jsonl", "w") as detections_file:
+        futures = {executor.submit(annotate, file): file for file in files}
+        for done, future in enumerate(as_completed(futures), start=1):
+            try:
+                record = future.result()
+            except Exception as e:
+                failed += 1
+                record = {"image": str(futures[future].relative_to(input_dir)), "error": str(e)}
+                print(f"❌ {record['image']}: {e}")
+            detections_file.write(json.dumps(record) + "\n")
+            if done % 100 == 0:
+                print(f"🖼️  {done}/{len(files)} images, {done / (time.perf_counter() - start):.1f} img/s")
+
+    elapsed = time.perf_counter() - start
+    print(f"✅ Annotated {len(files) - failed} images in {elapsed:.1f}s ({len(files) / elapsed:.1f} img/s), {failed} failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+"""
+Python client for the object detection service
+Pooled sync and async clients that upload image bytes to POST /detect, retry
+overload and transient errors with jittered exponential backoff, run bulk
+submissions with bounded concurrency and optionally cache results on disk
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Union
+
+import httpx
+
+# Overloaded (429), no replica capacity (503), gateway errors and deadline misses are worth retrying
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# Formats of POST /detect: json and columnar are JSON bodies, msgpack is the columnar payload as msgpack
+RESPONSE_FORMATS = ("json", "columnar", "msgpack")
+
+Image = Union[bytes, str, Path]
+
+
+class DetectionError(Exception):
+    """The service rejected the request or kept failing after all retries"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class ResultCache:
+    """Detections on local disk keyed by image content, service URL and response format"""
+
+    def __init__(self, cache_dir: Union[str, Path], ttl_s: Optional[float] = None):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.ttl_s = ttl_s
+
+    def key(self, image_bytes: bytes, *parts: str) -> str:
+        digest = hashlib.sha256(image_bytes)
+        for part in parts:
+            digest.update(part.encode())
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[dict]:
+        path = self.cache_dir / key[:2] / f"{key}.json"
+        if not path.exists():
+            return None
+        if self.ttl_s is not None and time.time() - path.stat().st_mtime > self.ttl_s:
+            return None
+        with open(path, "r") as f:
+            return json.load(f)
+
+    def put(self, key: str, result: dict):
+        path = self.cache_dir / key[:2] / f"{key}.json"
+        path.parent.mkdir(exist_ok=True)
+        # Write then rename, so concurrent readers never see a partial file
+        tmp_path = path.with_name(f"{path.name}.tmp-{os.getpid()}-{id(result)}")
+        with open(tmp_path, "w") as f:
+            json.dump(result, f)
+        os.replace(tmp_path, path)
+
+
+def read_image(image: Image) -> bytes:
+    if isinstance(image, bytes):
+        return image
+    with open(image, "rb") as f:
+        return f.read()
+
+
+def backoff_delay(attempt: int, base_s: float, max_s: float, retry_after: Optional[str] = None) -> float:
+    """Full-jitter exponential backoff, never shorter than the server's Retry-After"""
+    delay = random.uniform(0, min(max_s, base_s * 2 ** attempt))
+    if retry_after:
+        try:
+            delay = max(delay, float(retry_after))
+        except ValueError:
+            pass
+    return delay
+
+
+class _ClientBase:
+    def __init__(self, base_url: str, api_key: Optional[str] = None, response_format: str = "json",
+                 timeout_s: float = 30.0, max_connections: int = 32, retries: int = 3,
+                 backoff_s: float = 0.5, max_backoff_s: float = 10.0,
+                 cache_dir: Optional[Union[str, Path]] = None, cache_ttl_s: Optional[float] = None):
+        if response_format not in RESPONSE_FORMATS:
+            raise ValueError(f"Unknown response_format '{response_format}', expected one of {RESPONSE_FORMATS}")
+        self.base_url = base_url if base_url.endswith("/") else base_url + "/"
+        self.headers = {"Authorization": api_key} if api_key else {}
+        self.response_format = response_format
+        self.timeout_s = timeout_s
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self.retries = retries
+        self.backoff_s = backoff_s
+        self.max_backoff_s = max_backoff_s
+        self.cache = ResultCache(cache_dir, cache_ttl_s) if cache_dir else None
+
+    def _request_args(self, image_bytes: bytes, params: dict) -> dict:
+        return {
+            "url": f"{self.base_url}detect",
+            "params": {"format": self.response_format, **params},
+            "content": image_bytes,
+            "headers": {**self.headers, "Content-Type": "application/octet-stream"},
+        }
+
+    def _cache_key(self, image_bytes: bytes, params: dict) -> Optional[str]:
+        if self.cache is None:
+            return None
+        return self.cache.key(image_bytes, self.base_url, self.response_format, json.dumps(params, sort_keys=True))
+
+    def _should_retry(self, attempt: int, response: Optional[httpx.Response]) -> bool:
+        if attempt >= self.retries:
+            return False
+        return response is None or response.status_code in RETRY_STATUS_CODES
+
+    def _delay(self, attempt: int, response: Optional[httpx.Response]) -> float:
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        return backoff_delay(attempt, self.backoff_s, self.max_backoff_s, retry_after)
+
+    def _result(self, response: httpx.Response) -> dict:
+        if response.status_code != 200:
+            raise DetectionError(f"HTTP {response.status_code}: {response.text}", response.status_code)
+        if self.response_format == "msgpack":
+            import msgpack
+
+            return msgpack.unpackb(response.content)
+        return response.json()
+
+
+class DetectClient(_ClientBase):
+    """Thread-safe client with a pooled connection; bulk calls run on a bounded thread pool"""
+
+    def __init__(self, base_url: str, **kwargs):
+        super().__init__(base_url, **kwargs)
+        self.http_client = httpx.Client(timeout=self.timeout_s, limits=self.limits)
+
+    def detect(self, image: Image, **params) -> dict:
+        """Detects objects in image bytes or an image file; params are extra query parameters (e.g. tile_size)"""
+        image_bytes = read_image(image)
+        key = self._cache_key(image_bytes, params)
+        if key is not None and (cached := self.cache.get(key)) is not None:
+            return cached
+
+        attempt = 0
+        while True:
+            response = None
+            try:
+                response = self.http_client.post(**self._request_args(image_bytes, params))
+            except httpx.TransportError as e:
+                if not self._should_retry(attempt, None):
+                    raise DetectionError(f"Request failed after {attempt + 1} attempts: {e}")
+            if response is not None and not self._should_retry(attempt, response):
+                break
+            time.sleep(self._delay(attempt, response))
+            attempt += 1
+
+        result = self._result(response)
+        if key is not None:
+            self.cache.put(key, result)
+        return result
+
+    def detect_many(self, images: Iterable[Image], concurrency: int = 16, **params) -> Iterator[Union[dict, Exception]]:
+        """Yields results in input order; a failed image yields its exception instead of stopping the run"""
+        def detect_one(image):
+            try:
+                return self.detect(image, **params)
+            except Exception as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            # A bounded window of submissions, so a huge input iterable is never
+            # read into memory up front
+            pending = deque()
+            for image in images:
+                pending.append(executor.submit(detect_one, image))
+                if len(pending) >= 2 * concurrency:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def close(self):
+        self.http_client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class AsyncDetectClient(_ClientBase):
+    """asyncio client with a pooled connection; bulk calls keep at most `concurrency` requests in flight"""
+
+    def __init__(self, base_url: str, **kwargs):
+        super().__init__(base_url, **kwargs)
+        self.http_client = httpx.AsyncClient(timeout=self.timeout_s, limits=self.limits)
+
+    async def detect(self, image: Image, **params) -> dict:
+        """Detects objects in image bytes or an image file; params are extra query parameters (e.g. tile_size)"""
+        # File reads run on a worker thread, never blocking the event loop
+        image_bytes = image if isinstance(image, bytes) else await asyncio.to_thread(read_image, image)
+        key = self._cache_key(image_bytes, params)
+        if key is not None and (cached := self.cache.get(key)) is not None:
+            return cached
+
+        attempt = 0
+        while True:
+            response = None
+            try:
+                response = await self.http_client.post(**self._request_args(image_bytes, params))
+            except httpx.TransportError as e:
+                if not self._should_retry(attempt, None):
+                    raise DetectionError(f"Request failed after {attempt + 1} attempts: {e}")
+            if response is not None and not self._should_retry(attempt, response):
+                break
+            await asyncio.sleep(self._delay(attempt, response))
+            attempt += 1
+
+        result = self._result(response)
+        if key is not None:
+            self.cache.put(key, result)
+        return result
+
+    async def detect_many(self, images: Iterable[Image], concurrency: int = 16,
+                          **params) -> List[Union[dict, Exception]]:
+        """Returns results in input order; a failed image gets its exception instead of failing the batch"""
+        results = {}
+        # Bounded, so a huge input iterable is read only as fast as the workers keep up
+        queue = asyncio.Queue(maxsize=2 * concurrency)
+
+        async def worker():
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                index, image = item
+                try:
+                    results[index] = await self.detect(image, **params)
+                except Exception as e:
+                    results[index] = e
+
+        workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+        try:
+            count = 0
+            for count, image in enumerate(images, start=1):
+                await queue.put((count - 1, image))
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+        return [results[index] for index in range(count)]
+
+    async def close(self):
+        await self.http_client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
@@ -0,0 +1,93 @@
+"""
+Admission control for the object detection deployment
+Requests carry an absolute deadline; replicas reject work they cannot finish in
+time, or that would push their queue past a threshold, instead of letting every
+queued request time out together under overload
+"""
+
+import os
+import time
+from typing import Callable, Optional, Union
+
+# A time.time() timestamp, None for no deadline, or a callable returning either,
+# for a deadline that can move while the request waits (coalesced requests)
+Deadline = Union[None, float, Callable[[], Optional[float]]]
+
+
+class OverloadedError(Exception):
+    """The replica queue is full (HTTP 429)"""
+
+
+class DeadlineExceededError(Exception):
+    """The request deadline passed or cannot be met (HTTP 504)"""
+
+
+def resolve_deadline(deadline: Deadline) -> Optional[float]:
+    return deadline() if callable(deadline) else deadline
+
+
+def autoscaling_config() -> dict:
+    """Serve autoscaling settings for ObjectDetection, read from the environment at deploy time"""
+    max_batch_size = int(os.getenv("DETECT_MAX_BATCH_SIZE", "8"))
+    target_ongoing_requests = os.getenv("DETECT_TARGET_ONGOING_REQUESTS")
+    latency_target_ms = os.getenv("DETECT_LATENCY_TARGET_MS")
+    batch_latency_ms = os.getenv("DETECT_BATCH_LATENCY_MS")
+
+    if target_ongoing_requests:
+        target = float(target_ongoing_requests)
+    elif latency_target_ms and batch_latency_ms:
+        # Little's law: a replica finishes max_batch_size images every batch_latency_ms,
+        # so this many ongoing requests keeps queueing plus inference within the target
+        target = max(1.0, max_batch_size * float(latency_target_ms) / float(batch_latency_ms))
+    else:
+        target = float(max_batch_size)
+
+    return {
+        "min_replicas": int(os.getenv("DETECT_MIN_REPLICAS", "1")),
+        "max_replicas": int(os.getenv("DETECT_MAX_REPLICAS", "2")),
+        "target_ongoing_requests": target,
+        "upscale_delay_s": float(os.getenv("DETECT_UPSCALE_DELAY_S", "30")),
+        "downscale_delay_s": float(os.getenv("DETECT_DOWNSCALE_DELAY_S", "600")),
+    }
+
+
+class AdmissionController:
+    def __init__(self, max_queue_depth: int, max_batch_size: int, smoothing: float = 0.2):
+        # max_queue_depth=0 disables the queue depth limit
+        self.max_queue_depth = max_queue_depth
+        self.max_batch_size = max_batch_size
+        self.smoothing = smoothing
+        self.batch_latency_s: Optional[float] = None
+
+    def observe_batch_latency(self, seconds: float):
+        """Tracks an exponential moving average of inference time per batch"""
+        if self.batch_latency_s is None:
+            self.batch_latency_s = seconds
+        else:
+            self.batch_latency_s += self.smoothing * (seconds - self.batch_latency_s)
+
+    def estimated_wait_s(self, queue_depth: int) -> float:
+        """Time until a request joining the queue now would have its result"""
+        if self.batch_latency_s is None:
+            return 0.0
+        batches_ahead = queue_depth // self.max_batch_size + 1
+        return batches_ahead * self.batch_latency_s
+
+    def admit(self, queue_depth: int, deadline: Deadline):
+        """Raises when a new request should be rejected right away"""
+        if self.max_queue_depth and queue_depth >= self.max_queue_depth:
+            raise OverloadedError(f"Replica queue is full ({queue_depth} images waiting)")
+        self.check_deadline(deadline, queue_depth)
+
+    def check_deadline(self, deadline: Deadline, queue_depth: int = 0):
+        deadline = resolve_deadline(deadline)
+        if deadline is None:
+            return
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            raise DeadlineExceededError("Request deadline passed before inference")
+        if self.estimated_wait_s(queue_depth) > remaining:
+            raise DeadlineExceededError(
+                f"Request cannot finish within its deadline ({remaining * 1000:.0f}ms left, "
+                f"~{self.estimated_wait_s(queue_depth) * 1000:.0f}ms expected)"
+            )
@@ -0,0 +1,214 @@
+"""
+CPU inference backends for the object detection deployment
+PyTorch weights are exported once per artifact to ONNX Runtime, OpenVINO or
+TorchScript, cached on local disk, and loaded back through Ultralytics so every
+backend returns the same Results objects
+"""
+
+import importlib.util
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+from ultralytics import YOLO
+
+from disk_cache import materialize_once
+from model_store import safe_name
+from preprocessing import prepare_image
+
+BACKENDS = ("pytorch", "onnx", "openvino", "torchscript")
+
+# Precisions each exported format supports on CPU
+PRECISIONS = {
+    "pytorch": ("fp32",),
+    "onnx": ("fp32", "int8"),
+    "openvino": ("fp32", "fp16", "int8"),
+    "torchscript": ("fp32",),
+}
+
+# Runtimes that are not in requirements.txt, installed from requirements-backends.txt
+BACKEND_PACKAGES = {
+    "onnx": ("onnx", "onnxruntime"),
+    "openvino": ("openvino",),
+}
+
+DEFAULT_EXPORT_CACHE_DIR = os.path.join(Path.home(), ".cache", "ml-ops-project", "exports")
+
+
+class InferenceBackend:
+    """Runs letterboxed BCHW batches through an Ultralytics model of any format"""
+
+    def __init__(self, model: YOLO, name: str, precision: str, imgsz: int, static_batch: int = 0):
+        self.model = model
+        self.name = name
+        self.precision = precision
+        self.imgsz = imgsz
+        # Exported graphs with a fixed batch dimension need every batch padded to it
+        self.static_batch = static_batch
+
+    @property
+    def names(self):
+        return self.model.names
+
+    def predict(self, batch: torch.Tensor):
+        size = batch.shape[0]
+        if self.static_batch and size < self.static_batch:
+            padding = batch.new_zeros((self.static_batch - size, *batch.shape[1:]))
+            batch = torch.cat([batch, padding])
+        results = self.model(batch, imgsz=self.imgsz, verbose=False)
+        return results[:size]
+
+    def clone(self) -> "InferenceBackend":
+        """Loads an independent copy of the model, Ultralytics predictors are not thread-safe"""
+        model = YOLO(self.model.model_name, task=self.model.task)
+        return InferenceBackend(model, self.name, self.precision, self.imgsz, self.static_batch)
+
+
+class StubBackend(InferenceBackend):
+    """Stands in for the model in offline benchmarks: no weights, fixed detections, simulated compute time"""
+
+    def __init__(self, imgsz: int, batch_latency_s: float = 0.02, image_latency_s: float = 0.005):
+        self.name = "stub"
+        self.precision = "fp32"
+        self.imgsz = imgsz
+        self.static_batch = 0
+        self.batch_latency_s = batch_latency_s
+        self.image_latency_s = image_latency_s
+        self.stub_names = {0: "object"}
+        self.orig_img = np.zeros((imgsz, imgsz, 3), dtype=np.uint8)
+        # One centered box covering half the model input
+        quarter = imgsz / 4
+        self.boxes = torch.tensor([[quarter, quarter, 3 * quarter, 3 * quarter, 0.9, 0.0]])
+
+    @property
+    def names(self):
+        return self.stub_names
+
+    def clone(self) -> "StubBackend":
+        return StubBackend(self.imgsz, self.batch_latency_s, self.image_latency_s)
+
+    def predict(self, batch: torch.Tensor):
+        from ultralytics.engine.results import Results
+
+        size = batch.shape[0]
+        latency_s = self.batch_latency_s + self.image_latency_s * size
+        time.sleep(latency_s)
+        speed = {"preprocess": 0.0, "inference": latency_s * 1000 / size, "postprocess": 0.0}
+        return [
+            Results(self.orig_img, path="stub", names=self.stub_names, boxes=self.boxes.clone(), speed=speed)
+            for _ in range(size)
+        ]
+
+
+def load_backend(model_file: str, model_version: str, backend: str = "pytorch", precision: str = "fp32",
+                 imgsz: int = 640, batch_size: int = 8, cache_dir: str = DEFAULT_EXPORT_CACHE_DIR) -> InferenceBackend:
+    """Loads model_file with the requested backend, exporting and caching it on first use"""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
+    if precision not in PRECISIONS[backend]:
+        raise ValueError(f"Backend '{backend}' supports {PRECISIONS[backend]} precision, got '{precision}'")
+
+    if backend == "pytorch":
+        return InferenceBackend(YOLO(model_file), backend, precision, imgsz)
+    missing = [package for package in BACKEND_PACKAGES.get(backend, ()) if importlib.util.find_spec(package) is None]
+    if missing:
+        raise ImportError(f"Backend '{backend}' needs {missing}, install requirements-backends.txt")
+
+    # One export per model version, format, precision and input size
+    export_dir = Path(cache_dir) / safe_name(model_version) / f"{backend}-{precision}-{imgsz}-b{batch_size}"
+
+    def export(tmp_dir):
+        _export(model_file, tmp_dir, backend, precision, imgsz, batch_size)
+
+    # Replicas exporting the same artifact concurrently wait for the first export
+    if materialize_once(export_dir, export):
+        print(f"📁 Using cached {backend} export: {export_dir}")
+
+    with open(export_dir / "export.json", "r") as f:
+        metadata = json.load(f)
+    model = YOLO(str(export_dir / metadata["path"]), task="detect")
+    return InferenceBackend(model, backend, precision, imgsz, static_batch=metadata["static_batch"])
+
+
+def _export(model_file: str, tmp_dir: Path, backend: str, precision: str, imgsz: int, batch_size: int):
+    print(f"🛠️  Exporting model to {backend} ({precision}), this happens once per artifact...")
+    local_model = tmp_dir / "model.pt"
+    shutil.copy2(model_file, local_model)
+
+    model = YOLO(str(local_model))
+    export_args = {"format": backend, "imgsz": imgsz, "batch": batch_size, "device": "cpu"}
+    if backend in ("onnx", "openvino"):
+        export_args["dynamic"] = True
+    if backend == "openvino":
+        export_args["half"] = precision == "fp16"
+        export_args["int8"] = precision == "int8"
+        if precision == "int8":
+            export_args["data"] = os.getenv("DETECT_INT8_DATA", "coco8.yaml")
+    exported = Path(model.export(**export_args))
+
+    if backend == "onnx" and precision == "int8":
+        exported = _quantize_onnx(exported)
+
+    metadata = {
+        "path": exported.name,
+        # TorchScript traces a fixed batch dimension, ONNX and OpenVINO are exported dynamic
+        "static_batch": batch_size if backend == "torchscript" else 0,
+    }
+    with open(tmp_dir / "export.json", "w") as f:
+        json.dump(metadata, f)
+
+
+def _quantize_onnx(model_path: Path) -> Path:
+    """Quantizes ONNX weights to INT8 with ONNX Runtime dynamic quantization"""
+    import onnx
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantized_path = model_path.with_name(f"{model_path.stem}_int8.onnx")
+    quantize_dynamic(str(model_path), str(quantized_path), weight_type=QuantType.QUInt8)
+
+    # Keep the Ultralytics metadata (class names, stride, imgsz) the quantizer drops
+    source, quantized = onnx.load(str(model_path)), onnx.load(str(quantized_path))
+    del quantized.metadata_props[:]
+    quantized.metadata_props.extend(source.metadata_props)
+    onnx.save(quantized, str(quantized_path))
+    return quantized_path
+
+
+def check_parity(reference: InferenceBackend, candidate: InferenceBackend, min_iou: float = 0.9) -> bool:
+    """Compares candidate detections against the PyTorch reference on a sample image"""
+    from ultralytics.utils import ASSETS
+
+    with open(ASSETS / "bus.jpg", "rb") as f:
+        image = prepare_image(f.read(), reference.imgsz)
+    batch = torch.from_numpy(image.tensor[None])
+    expected = reference.predict(batch)[0].boxes
+    actual = candidate.predict(batch)[0].boxes
+
+    if len(expected) != len(actual):
+        print(f"⚠️  Parity: {candidate.name} found {len(actual)} objects, PyTorch found {len(expected)}")
+        return False
+
+    expected_cls, actual_cls = expected.cls.cpu().numpy(), actual.cls.cpu().numpy()
+    ious = _box_iou(expected.xyxy.cpu().numpy(), actual.xyxy.cpu().numpy())
+    # Every reference box needs a same-class match with enough overlap
+    ious[expected_cls[:, None] != actual_cls[None, :]] = 0
+    worst = float(ious.max(axis=1).min()) if len(expected) else 1.0
+    if worst < min_iou:
+        print(f"⚠️  Parity: {candidate.name} worst box IoU {worst:.3f} is below {min_iou}")
+        return False
+
+    print(f"✅ Parity: {candidate.name} ({candidate.precision}) matches PyTorch, worst box IoU {worst:.3f}")
+    return True
+
+
+def _box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    intersection = (bottom_right - top_left).clip(0).prod(axis=2)
+    area_a = (a[:, 2:] - a[:, :2]).prod(axis=1)
+    area_b = (b[:, 2:] - b[:, :2]).prod(axis=1)
+    return intersection / (area_a[:, None] + area_b[None, :] - intersection + 1e-9)
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Offline batch inference over large image corpora with Ray Data
+Reads image paths or URLs from a local directory, a gs:// prefix or a JSONL
+manifest, decodes them on parallel workers, runs batched inference on a pool of
+model actors (same model loading as the ObjectDetection deployment) and writes
+detections to Parquet in fixed-size chunks. Chunks already written are skipped,
+so a crashed job picks up where it stopped
+"""
+
+import argparse
+import json
+import math
+import os
+import posixpath
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+import ray
+import torch
+
+from model_loader import load_detection_model
+from preprocessing import PreparedImage, prepare_image, scale_boxes
+
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png")
+MANIFEST_FILE = "_job.json"
+# Input blocks per decoder and model actor, so every worker has the next block
+# ready without the scheduling overhead of one task per batch
+BLOCKS_PER_WORKER = 4
+
+
+def filesystem(uri: str) -> Tuple[pafs.FileSystem, str]:
+    """Local paths and gs:// (or any pyarrow-supported) URIs"""
+    if "://" in uri:
+        return pafs.FileSystem.from_uri(uri)
+    return pafs.LocalFileSystem(), os.path.abspath(uri)
+
+
+def list_inputs(source: str) -> List[str]:
+    """Image paths or URLs of a JSONL manifest (image_url or image_path per line) or a directory, in a stable order"""
+    fs, path = filesystem(source)
+    if source.endswith(".jsonl"):
+        # image_path entries are relative to the manifest
+        base = posixpath.dirname(source) if "://" in source else os.path.dirname(path)
+        inputs = []
+        with fs.open_input_stream(path) as f:
+            for line in f.read().decode().splitlines():
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if "image_url" in entry:
+                    inputs.append(entry["image_url"])
+                elif "image_path" in entry:
+                    inputs.append(f"{base}/{entry['image_path']}")
+        return inputs
+
+    infos = fs.get_file_info(pafs.FileSelector(path, recursive=True))
+    prefix = source.split("://")[0] + "://" if "://" in source else ""
+    return sorted(
+        prefix + info.path for info in infos
+        if info.type == pafs.FileType.File and info.path.lower().endswith(IMAGE_SUFFIXES)
+    )
+
+
+def read_bytes(source: str, http_client) -> bytes:
+    if source.startswith(("http://", "https://")):
+        response = http_client.get(source)
+        response.raise_for_status()
+        return response.content
+    fs, path = filesystem(source)
+    with fs.open_input_stream(path) as f:
+        return f.read()
+
+
+class Decoder:
+    """Fetches and letterboxes a batch of images on a pool of CPU workers, pipelined with inference"""
+
+    def __init__(self, imgsz: int, fetch_timeout_s: float):
+        import httpx
+
+        self.imgsz = imgsz
+        self.http_client = httpx.Client(timeout=fetch_timeout_s, follow_redirects=True)
+
+    def __call__(self, batch: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        size = len(batch["source"])
+        tensors = np.zeros((size, 3, self.imgsz, self.imgsz), dtype=np.float32)
+        # scale, pad left, pad top, height, width
+        geometry = np.zeros((size, 5), dtype=np.float32)
+        errors = np.full(size, "", dtype=object)
+        for i, source in enumerate(batch["source"]):
+            try:
+                image = prepare_image(read_bytes(source, self.http_client), self.imgsz)
+            except Exception as e:
+                # A broken image is recorded in the output instead of failing the job
+                errors[i] = str(e)
+                continue
+            tensors[i] = image.tensor
+            geometry[i] = (image.scale, *image.pad, *image.shape)
+        return {**batch, "tensor": tensors, "geometry": geometry, "error": errors}
+
+
+class Detector:
+    """Model actor, loaded once and reused for every batch it receives"""
+
+    def __init__(self, artifact_name: str, project: str, entity: str, imgsz: int, batch_size: int):
+        offline = os.getenv("DETECT_OFFLINE", "0") == "1" or os.getenv("WANDB_MODE") == "offline"
+        stub = os.getenv("DETECT_STUB_MODEL", "0") == "1"
+        self.backend, artifact_version = load_detection_model(
+            artifact_name, project, entity, imgsz=imgsz, batch_size=batch_size, offline=offline, stub=stub,
+        )
+        self.model_version = f"{artifact_version}/{self.backend.name}-{self.backend.precision}"
+
+    def __call__(self, batch: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        size = len(batch["source"])
+        classes, scores, boxes = [[] for _ in range(size)], [[] for _ in range(size)], [[] for _ in range(size)]
+        ok = [i for i in range(size) if not batch["error"][i]]
+        if ok:
+            results = self.backend.predict(torch.from_numpy(batch["tensor"][ok]))
+            for i, result in zip(ok, results):
+                scale, left, top, height, width = batch["geometry"][i].tolist()
+                data = result.boxes.data.cpu().numpy()
+                image = PreparedImage(None, scale, (left, top), (int(height), int(width)))
+                classes[i] = [result.names[c] for c in data[:, 5].astype(np.int64).tolist()]
+                scores[i] = data[:, 4].tolist()
+                boxes[i] = scale_boxes(data[:, :4], image).tolist()
+        return {
+            "chunk": batch["chunk"],
+            "source": batch["source"],
+            "model_version": np.full(size, self.model_version, dtype=object),
+            "classes": _object_array(classes),
+            "scores": _object_array(scores),
+            "boxes": _object_array(boxes),
+            "error": batch["error"],
+        }
+
+
+def _object_array(values: list) -> np.ndarray:
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+class ChunkWriter:
+    """Writes one Parquet file per chunk; a file only appears under its final name once complete"""
+
+    def __init__(self, output: str):
+        self.fs, self.path = filesystem(output)
+        self.fs.create_dir(self.path, recursive=True)
+
+    def chunk_path(self, chunk: int) -> str:
+        return f"{self.path}/chunk-{chunk:06d}.parquet"
+
+    def completed_chunks(self) -> set:
+        infos = self.fs.get_file_info(pafs.FileSelector(self.path))
+        names = [posixpath.basename(info.path) for info in infos]
+        return {
+            int(name[len("chunk-"):-len(".parquet")]) for name in names
+            if name.startswith("chunk-") and name.endswith(".parquet")
+        }
+
+    def check_job(self, job: dict):
+        """Refuses to resume into an output written with a different chunking of the inputs"""
+        manifest_path = f"{self.path}/{MANIFEST_FILE}"
+        if self.fs.get_file_info(manifest_path).type == pafs.FileType.File:
+            with self.fs.open_input_stream(manifest_path) as f:
+                previous = json.loads(f.read())
+            if previous != job:
+                raise ValueError(f"{self.path} was written by a different job ({previous}), use a new --output")
+        else:
+            with self.fs.open_output_stream(manifest_path) as f:
+                f.write(json.dumps(job).encode())
+
+    def write(self, chunk: int, rows: Dict[str, list]):
+        table = pa.table(rows)
+        tmp_path = f"{self.chunk_path(chunk)}.tmp"
+        pq.write_table(table, tmp_path, filesystem=self.fs)
+        self.fs.move(tmp_path, self.chunk_path(chunk))
+
+
+def input_blocks(images: int, batch_size: int, chunk_size: int, workers: int) -> int:
+    """Number of blocks the image list is split into, from the size of the worker pool"""
+    blocks = workers * BLOCKS_PER_WORKER
+    # No block spans more than a chunk, or holds less than a batch
+    blocks = max(blocks, math.ceil(images / chunk_size))
+    return max(1, min(blocks, images // batch_size))
+
+
+def run(args):
+    inputs = list_inputs(args.input)
+    chunks = [inputs[i:i + args.chunk_size] for i in range(0, len(inputs), args.chunk_size)]
+    print(f"📁 {len(inputs)} images in {len(chunks)} chunks of up to {args.chunk_size}")
+
+    writer = ChunkWriter(args.output)
+    writer.check_job({"input": args.input, "images": len(inputs), "chunk_size": args.chunk_size})
+    done = writer.completed_chunks()
+    pending = [chunk for chunk in range(len(chunks)) if chunk not in done]
+    if done:
+        print(f"⏭️  Skipping {len(done)} chunks that are already written")
+    if not pending:
+        print("✅ Nothing left to do")
+        return
+
+    ray.init(ignore_reinit_error=True)
+    # Rows come out in input order, so a chunk is complete as soon as the next one starts
+    ray.data.DataContext.get_current().execution_options.preserve_order = True
+
+    items = [{"chunk": chunk, "source": source} for chunk in pending for source in chunks[chunk]]
+    dataset = (
+        ray.data.from_items(items, override_num_blocks=input_blocks(
+            len(items), args.batch_size, args.chunk_size, args.decoders + args.max_actors
+        ))
+        .map_batches(
+            Decoder,
+            fn_constructor_args=(args.imgsz, args.fetch_timeout),
+            batch_size=args.batch_size,
+            concurrency=args.decoders,
+            batch_format="numpy",
+        )
+        .map_batches(
+            Detector,
+            fn_constructor_args=(args.model_artifact, args.project, args.entity, args.imgsz, args.batch_size),
+            batch_size=args.batch_size,
+            concurrency=(args.min_actors, args.max_actors),
+            num_cpus=args.cpus_per_actor,
+            batch_format="numpy",
+        )
+    )
+
+    start = time.perf_counter()
+    processed = 0
+    current, rows = None, None
+    for batch in dataset.iter_batches(batch_size=None, batch_format="numpy"):
+        for i, chunk in enumerate(batch["chunk"].tolist()):
+            if chunk != current:
+                if current is not None:
+                    writer.write(current, rows)
+                    print(f"💾 Chunk {current} written ({processed} images, {processed / (time.perf_counter() - start):.1f} img/s)")
+                current, rows = chunk, {key: [] for key in batch if key != "chunk"}
+            for key in rows:
+                value = batch[key][i]
+                rows[key].append(value.tolist() if isinstance(value, np.ndarray) else value)
+            processed += 1
+    if current is not None:
+        writer.write(current, rows)
+        print(f"💾 Chunk {current} written")
+    print(f"✅ {processed} images in {time.perf_counter() - start:.1f}s, detections in {args.output}")
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Run object detection over an image corpus with Ray Data')
+    parser.add_argument('--input', type=str, required=True,
+                        help='Local directory, gs:// prefix, or JSONL manifest (image_url or image_path per line)')
+    parser.add_argument('--output', type=str, required=True, help='Directory (local or gs://) for Parquet chunks')
+    parser.add_argument('--model-artifact', type=str, default=os.getenv("WANDB_MODEL_ARTIFACT", ""),
+                        help='W&B model artifact, defaults to WANDB_MODEL_ARTIFACT')
+    parser.add_argument('--project', type=str, default=os.getenv("WANDB_PROJECT", "ml-ops-project"))
+    parser.add_argument('--entity', type=str, default=os.getenv("WANDB_ENTITY", "maslov-mykhailo-set-university"))
+    parser.add_argument('--chunk-size', type=int, default=10000, help='Images per Parquet file')
+    parser.add_argument('--batch-size', type=int, default=16, help='Images per inference batch')
+    parser.add_argument('--imgsz', type=int, default=640, help='Model input size')
+    parser.add_argument('--decoders', type=int, default=4, help='Parallel fetch and decode tasks')
+    parser.add_argument('--min-actors', type=int, default=1, help='Minimum model actors')
+    parser.add_argument('--max-actors', type=int, default=4, help='Maximum model actors')
+    parser.add_argument('--cpus-per-actor', type=float, default=4, help='CPUs reserved by each model actor')
+    parser.add_argument('--fetch-timeout', type=float, default=30.0, help='Timeout for fetching an image by URL')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    run(parse_arguments())
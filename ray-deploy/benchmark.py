@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Load testing and benchmark harness for the object detection service
+Starts the entrypoint Serve app locally (or targets a running deployment),
+replays a request corpus with closed-loop or open-loop load and writes
+throughput, latency percentiles and CPU utilization to a JSON report
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+import numpy as np
+import psutil
+
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png")
+
+
+def load_corpus(corpus_path):
+    """Loads requests from a JSONL file ({"image_url": ...} or {"image_path": ...} per line) or an image directory"""
+    path = Path(corpus_path)
+    if path.is_dir():
+        files = sorted(p for p in path.rglob("*") if p.suffix.lower() in IMAGE_SUFFIXES)
+        return [{"image_bytes": f.read_bytes(), "name": str(f)} for f in files]
+
+    corpus = []
+    with open(path, "r") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if "image_path" in entry:
+                image_path = path.parent / entry["image_path"]
+                corpus.append({"image_bytes": image_path.read_bytes(), "name": str(image_path)})
+            elif "image_url" in entry:
+                corpus.append({"image_url": entry["image_url"], "name": entry["image_url"]})
+    return corpus
+
+
+def start_local_app(stub_model):
+    """Runs the entrypoint Serve app on a local Ray instance and returns its URL"""
+    env_vars = {}
+    if stub_model:
+        env_vars.update({"DETECT_STUB_MODEL": "1", "DETECT_OFFLINE": "1", "WANDB_MODE": "offline"})
+        os.environ.update(env_vars)
+
+    import ray
+    from ray import serve
+
+    ray.init(runtime_env={"env_vars": env_vars}, include_dashboard=False)
+    from object_detection import entrypoint
+    serve.run(entrypoint, route_prefix="/")
+    print("✅ Serve app started locally")
+    return "http://127.0.0.1:8000/"
+
+
+async def send_request(client, url, item, response_format, cache_bust):
+    params = {"format": response_format}
+    if "image_bytes" in item:
+        image_bytes = item["image_bytes"]
+        if cache_bust:
+            # Unique trailing bytes keep the result cache from answering repeats;
+            # JPEG and PNG decoders ignore data after the end of the image
+            image_bytes = image_bytes + os.urandom(8)
+        return await client.post(f"{url}detect", params=params, content=image_bytes,
+                                 headers={"Content-Type": "application/octet-stream"})
+    params["image_url"] = item["image_url"]
+    return await client.get(f"{url}detect", params=params)
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = []
+        self.errors = {}
+
+    def record(self, latency, status):
+        if status == 200:
+            self.latencies.append(latency)
+        else:
+            self.errors[str(status)] = self.errors.get(str(status), 0) + 1
+
+
+async def timed_request(client, url, item, args, recorder, scheduled_at=None):
+    # Open-loop latency is measured from the scheduled send time, so a slow
+    # server cannot hide queueing by delaying the load generator
+    start = scheduled_at if scheduled_at is not None else time.perf_counter()
+    try:
+        response = await send_request(client, url, item, args.format, args.cache_bust)
+        status = response.status_code
+    except httpx.HTTPError as e:
+        status = type(e).__name__
+    recorder.record(time.perf_counter() - start, status)
+
+
+async def closed_loop(client, url, corpus, args, recorder, deadline):
+    """N workers, each sends its next request as soon as the previous one completes"""
+    async def worker(worker_id):
+        index = worker_id
+        while time.perf_counter() < deadline:
+            await timed_request(client, url, corpus[index % len(corpus)], args, recorder)
+            index += args.concurrency
+
+    await asyncio.gather(*(worker(i) for i in range(args.concurrency)))
+
+
+async def open_loop(client, url, corpus, args, recorder, deadline):
+    """Poisson arrivals at a fixed rate, independent of how fast the server answers"""
+    tasks = []
+    index = 0
+    next_send = time.perf_counter()
+    while next_send < deadline:
+        delay = next_send - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(
+            timed_request(client, url, corpus[index % len(corpus)], args, recorder, scheduled_at=next_send)
+        ))
+        index += 1
+        next_send += random.expovariate(args.rate)
+    await asyncio.gather(*tasks)
+
+
+async def sample_cpu(samples, stop):
+    psutil.cpu_percent(interval=None)
+    while not stop.is_set():
+        await asyncio.sleep(0.5)
+        samples.append(psutil.cpu_percent(interval=None))
+
+
+async def run_benchmark(url, corpus, args):
+    limits = httpx.Limits(max_connections=max(args.concurrency, 100))
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        if args.warmup:
+            print(f"🔥 Warming up with {args.warmup} requests...")
+            warmup = Recorder()
+            for i in range(args.warmup):
+                await timed_request(client, url, corpus[i % len(corpus)], args, warmup)
+
+        print(f"🚀 Running {args.mode}-loop load for {args.duration}s...")
+        recorder = Recorder()
+        cpu_samples = []
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(sample_cpu(cpu_samples, stop))
+        start = time.perf_counter()
+        deadline = start + args.duration
+        if args.mode == "closed":
+            await closed_loop(client, url, corpus, args, recorder, deadline)
+        else:
+            await open_loop(client, url, corpus, args, recorder, deadline)
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await sampler
+        # Average batch inference time of the replica that answers, measured under this load
+        response = await client.get(f"{url}model")
+        model = response.json() if response.status_code == 200 else {}
+
+    latencies_ms = np.array(recorder.latencies) * 1000
+    # CPU is sampled on this machine: the server's only when the app runs locally,
+    # otherwise just the load generator's
+    cpu_prefix = "client_cpu" if args.url else "cpu"
+    summary = {
+        "requests": len(recorder.latencies) + sum(recorder.errors.values()),
+        "successes": len(recorder.latencies),
+        "errors": recorder.errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(recorder.latencies) / elapsed, 2),
+        f"{cpu_prefix}_percent_avg": round(float(np.mean(cpu_samples)), 1) if cpu_samples else None,
+        f"{cpu_prefix}_percent_max": round(float(np.max(cpu_samples)), 1) if cpu_samples else None,
+        "batch_latency_ms": model.get("batch_latency_ms"),
+    }
+    if len(latencies_ms):
+        summary.update({
+            "latency_ms_mean": round(float(latencies_ms.mean()), 2),
+            "latency_ms_p50": round(float(np.percentile(latencies_ms, 50)), 2),
+            "latency_ms_p95": round(float(np.percentile(latencies_ms, 95)), 2),
+            "latency_ms_p99": round(float(np.percentile(latencies_ms, 99)), 2),
+        })
+    return summary
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Benchmark the object detection service')
+    parser.add_argument('--corpus', type=str, required=True,
+                        help='JSONL request corpus (image_url or image_path per line) or a directory of images')
+    parser.add_argument('--url', type=str, default=None,
+                        help='Target a running deployment instead of starting the app locally')
+    parser.add_argument('--stub-model', action='store_true',
+                        help='Serve fixed detections without weights, W&B or internet access')
+    parser.add_argument('--mode', choices=['closed', 'open'], default='closed',
+                        help='closed: fixed concurrency, open: Poisson arrivals at --rate')
+    parser.add_argument('--concurrency', type=int, default=8, help='Closed-loop concurrent clients')
+    parser.add_argument('--rate', type=float, default=20.0, help='Open-loop requests per second')
+    parser.add_argument('--duration', type=float, default=30.0, help='Measured load duration in seconds')
+    parser.add_argument('--warmup', type=int, default=10, help='Requests sent before measuring')
+    parser.add_argument('--timeout', type=float, default=60.0, help='Per-request timeout in seconds')
+    parser.add_argument('--format', type=str, default='json', help='Response format to request')
+    parser.add_argument('--cache-bust', action='store_true',
+                        help='Make every uploaded image unique so the result cache is bypassed')
+    parser.add_argument('--output', type=str, default=None, help='Where to write the JSON report')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    corpus = load_corpus(args.corpus)
+    if not corpus:
+        print(f"❌ No requests found in {args.corpus}")
+        return
+    print(f"📁 Loaded {len(corpus)} requests from {args.corpus}")
+
+    url = args.url or start_local_app(args.stub_model)
+    if not url.endswith("/"):
+        url += "/"
+
+    summary = asyncio.run(run_benchmark(url, corpus, args))
+
+    print("=" * 40)
+    for key, value in summary.items():
+        print(f"  {key}: {value}")
+    if summary["batch_latency_ms"]:
+        print(f"💡 Deploy with DETECT_BATCH_LATENCY_MS={summary['batch_latency_ms']} to size autoscaling from it")
+
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "config": {k: v for k, v in vars(args).items()},
+        "environment": {
+            "cpu_count": os.cpu_count(),
+            "DETECT_MAX_BATCH_SIZE": os.getenv("DETECT_MAX_BATCH_SIZE"),
+            "DETECT_BACKEND": os.getenv("DETECT_BACKEND"),
+        },
+        "results": summary,
+    }
+    output = args.output or f"benchmark-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"💾 Report written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+CPU thread layout for the object detection deployment
+A replica runs one or more model instances, each on its own inference thread with
+a fixed number of intra-op threads and optionally pinned to a set of cores, and
+reserves as many CPUs from Ray as the layout actually uses
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, NamedTuple, Optional
+
+import torch
+from filelock import FileLock
+
+# Cores pinned by replicas on this node, shared through a small claims file
+DEFAULT_CORE_CLAIMS_FILE = os.path.join(tempfile.gettempdir(), "ml-ops-project-cores.json")
+
+
+class CpuLayout(NamedTuple):
+    instances: int
+    # 0 keeps the runtime default
+    intra_op_threads: int
+    inter_op_threads: int
+    num_cpus: float
+    pin_cores: bool
+
+
+def cpu_layout() -> CpuLayout:
+    """Thread layout of an ObjectDetection replica, read from the environment"""
+    instances = max(1, int(os.getenv("DETECT_MODEL_INSTANCES", "1")))
+    # Several instances default to one thread each, instead of each sizing its
+    # threadpool to every core of the node; a single instance keeps the runtime default
+    intra_op_threads = int(os.getenv("DETECT_INTRA_OP_THREADS", "0")) or (1 if instances > 1 else 0)
+    inter_op_threads = int(os.getenv("DETECT_INTER_OP_THREADS", "0"))
+    # One reserved CPU per thread, a single instance without a thread count keeps Ray's default of one
+    num_cpus = float(os.getenv("DETECT_NUM_CPUS", "0")) or max(1, instances * intra_op_threads)
+    pin_cores = os.getenv("DETECT_PIN_CORES", "0") == "1"
+    return CpuLayout(instances, intra_op_threads, inter_op_threads, num_cpus, pin_cores)
+
+
+def configure_process_threads(layout: CpuLayout):
+    """Applies the process-wide torch thread settings, before any inference runs"""
+    if layout.inter_op_threads:
+        try:
+            torch.set_num_interop_threads(layout.inter_op_threads)
+        except RuntimeError as e:
+            # Only allowed once per process, before inter-op parallel work started
+            print(f"⚠️  Could not set inter-op threads: {e}")
+    if layout.intra_op_threads:
+        torch.set_num_threads(layout.intra_op_threads)
+
+
+def claim_cores(count: int, claims_file: str = DEFAULT_CORE_CLAIMS_FILE) -> Optional[List[int]]:
+    """Reserves count cores on this node that no other live replica has pinned, None if not enough are free"""
+    with FileLock(f"{claims_file}.lock"):
+        claims = {}
+        if os.path.exists(claims_file):
+            with open(claims_file, "r") as f:
+                claims = json.load(f)
+        # Drop claims of replicas that are gone
+        claims = {pid: cores for pid, cores in claims.items() if _is_alive(int(pid))}
+
+        taken = {core for cores in claims.values() for core in cores}
+        free = [core for core in sorted(os.sched_getaffinity(0)) if core not in taken]
+        if len(free) < count:
+            return None
+        claims[str(os.getpid())] = free[:count]
+
+        tmp_file = f"{claims_file}.tmp-{os.getpid()}"
+        with open(tmp_file, "w") as f:
+            json.dump(claims, f)
+        os.replace(tmp_file, claims_file)
+    return free[:count]
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _init_inference_thread(cores: Optional[List[int]], intra_op_threads: int):
+    # Affinity and the OpenMP thread count are per thread on Linux, and threads the
+    # runtimes spawn from here inherit them
+    if cores:
+        os.sched_setaffinity(0, cores)
+    if intra_op_threads:
+        torch.set_num_threads(intra_op_threads)
+
+
+class ModelInstancePool:
+    """Model instances, each on a dedicated inference thread; calls go to whichever instance is free"""
+
+    def __init__(self, layout: CpuLayout):
+        self.layout = layout
+        threads_per_instance = layout.intra_op_threads or max(1, int(layout.num_cpus))
+        core_sets = [None] * layout.instances
+        if layout.pin_cores:
+            cores = claim_cores(threads_per_instance * layout.instances)
+            if cores is None:
+                print("⚠️  Not enough unclaimed cores on this node, instances are not pinned")
+            else:
+                core_sets = [
+                    cores[i * threads_per_instance:(i + 1) * threads_per_instance]
+                    for i in range(layout.instances)
+                ]
+        self.core_sets = core_sets
+        self.executors = [self._thread_pool(f"inference-{i}", cores) for i, cores in enumerate(core_sets)]
+        self.backends = []
+        self.free: Optional[asyncio.Queue] = None
+        for i, cores in enumerate(core_sets):
+            print(f"🧵 Model instance {i}: cores={cores or 'any'}, intra_op_threads={layout.intra_op_threads or 'default'}")
+
+    def _thread_pool(self, name: str, cores: Optional[List[int]]) -> ThreadPoolExecutor:
+        return ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix=name,
+            initializer=_init_inference_thread,
+            initargs=(cores, self.layout.intra_op_threads),
+        )
+
+    def prepare(self, backend, warmup: Callable) -> list:
+        """Builds and warms one copy of backend per instance, without touching the serving instances"""
+        # Each copy is loaded and warmed on a short-lived thread with its instance's
+        # affinity, so runtime thread pools start out on the right cores and the
+        # inference threads keep serving meanwhile
+        backends = []
+        for i, cores in enumerate(self.core_sets):
+            with self._thread_pool(f"loader-{i}", cores) as loader:
+                copy = backend if i == 0 else loader.submit(backend.clone).result()
+                loader.submit(warmup, copy).result()
+            backends.append(copy)
+        return backends
+
+    def activate(self, backends: list):
+        """Switches every instance to the prepared backends, batches already running finish on the old ones"""
+        self.backends = backends
+
+    async def acquire(self) -> int:
+        """Waits for a free instance and returns its index"""
+        if self.free is None:
+            # Created lazily so it binds to the replica's event loop
+            self.free = asyncio.Queue()
+            for i in range(len(self.executors)):
+                self.free.put_nowait(i)
+        return await self.free.get()
+
+    def release(self, instance: int):
+        self.free.put_nowait(instance)
+
+    async def run(self, instance: int, fn: Callable, *args):
+        """Runs fn(backend, *args) on the instance's inference thread"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executors[instance], fn, self.backends[instance], *args)
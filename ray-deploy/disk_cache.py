@@ -0,0 +1,46 @@
+"""
+Build-once directories in node-local caches
+Processes on one node that need the same entry wait on a file lock for the first
+one to build it; an entry counts as built only once its completion marker exists,
+so an interrupted build is thrown away and redone
+"""
+
+import shutil
+from pathlib import Path
+from typing import Callable
+
+from filelock import FileLock
+
+# Written last, a cache entry without it is an interrupted build
+COMPLETE_MARKER = ".complete"
+
+
+def materialize_once(path, build: Callable[[Path], None], in_place: bool = False) -> bool:
+    """Runs build(directory) so path exists with its contents, at most once per node; returns True on a cache hit
+
+    build fills a private temporary directory that is moved into place when it returns,
+    in_place builds straight into path instead, for contents that record their own
+    location (a virtualenv)
+    """
+    path = Path(path)
+    if (path / COMPLETE_MARKER).exists():
+        return True
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with FileLock(str(path) + ".lock"):
+        if (path / COMPLETE_MARKER).exists():
+            return True
+
+        target = path if in_place else path.with_name(f"{path.name}.tmp")
+        shutil.rmtree(path, ignore_errors=True)
+        shutil.rmtree(target, ignore_errors=True)
+        target.mkdir()
+        try:
+            build(target)
+        except BaseException:
+            shutil.rmtree(target, ignore_errors=True)
+            raise
+        (target / COMPLETE_MARKER).touch()
+        if not in_place:
+            target.rename(path)
+    return False
@@ -0,0 +1,98 @@
+"""
+Latency and load metrics for the object detection service
+Every Serve replica process exports its own Prometheus endpoint; metrics are also
+sent over OTLP when OpenTelemetry is configured (OTEL_EXPORTER_OTLP_ENDPOINT)
+"""
+
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+# fetch, decode, preprocess, inference, nms, merge (tiled mode), postprocess, serialization
+STAGE_LATENCY = Histogram(
+    "detect_stage_latency_seconds",
+    "Latency of each detection pipeline stage",
+    ["stage"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+BATCH_SIZE = Gauge("detect_batch_size", "Number of images in the last inference batch")
+BATCH_SIZES = Histogram(
+    "detect_batch_size_images",
+    "Number of images per inference batch",
+    buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+QUEUE_DEPTH = Gauge("detect_queue_depth", "Images waiting for or running inference")
+ERRORS = Counter("detect_errors_total", "Failed detection requests by cause", ["cause"])
+
+
+class Metrics:
+    def __init__(self):
+        self.otel_stage_latency = None
+        self.otel_batch_size = None
+        self.otel_errors = None
+        self.queue_depth = 0
+        if os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"):
+            self._setup_otel()
+
+    def _setup_otel(self):
+        try:
+            from opentelemetry import metrics
+            from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import OTLPMetricExporter
+            from opentelemetry.sdk.metrics import MeterProvider
+            from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
+        except ImportError as e:
+            print(f"⚠️  OpenTelemetry is not installed, exporting Prometheus metrics only: {e}")
+            return
+
+        reader = PeriodicExportingMetricReader(OTLPMetricExporter())
+        metrics.set_meter_provider(MeterProvider(metric_readers=[reader]))
+        meter = metrics.get_meter("object_detection")
+        self.otel_stage_latency = meter.create_histogram("detect.stage.latency", unit="s")
+        self.otel_batch_size = meter.create_histogram("detect.batch.size")
+        self.otel_errors = meter.create_counter("detect.errors")
+        meter.create_observable_gauge(
+            "detect.queue.depth",
+            callbacks=[lambda options: [metrics.Observation(self.queue_depth)]],
+        )
+        print("📡 Exporting metrics over OTLP")
+
+    def observe_stage(self, stage: str, seconds: float):
+        STAGE_LATENCY.labels(stage=stage).observe(seconds)
+        if self.otel_stage_latency is not None:
+            self.otel_stage_latency.record(seconds, {"stage": stage})
+
+    @contextmanager
+    def time_stage(self, stage: str):
+        start = time.perf_counter()
+        yield
+        self.observe_stage(stage, time.perf_counter() - start)
+
+    def observe_batch(self, size: int):
+        BATCH_SIZE.set(size)
+        BATCH_SIZES.observe(size)
+        if self.otel_batch_size is not None:
+            self.otel_batch_size.record(size)
+
+    def add_queue_depth(self, delta: int):
+        self.queue_depth += delta
+        QUEUE_DEPTH.set(self.queue_depth)
+
+    def count_error(self, cause: str):
+        ERRORS.labels(cause=cause).inc()
+        if self.otel_errors is not None:
+            self.otel_errors.add(1, {"cause": cause})
+
+
+def start_metrics_server(base_port: int, max_attempts: int = 16) -> int:
+    """Serves Prometheus metrics on the first free port from base_port, several replicas may share a node"""
+    for port in range(base_port, base_port + max_attempts):
+        try:
+            start_http_server(port)
+        except OSError:
+            continue
+        print(f"📊 Prometheus metrics on port {port}")
+        return port
+    print(f"⚠️  No free port for Prometheus metrics in {base_port}-{base_port + max_attempts - 1}")
+    return 0
@@ -0,0 +1,105 @@
+"""
+Model loading shared by the detection service and the offline batch job
+Resolves a W&B model artifact through the node-local cache and wraps it in the
+configured CPU inference backend
+"""
+
+import os
+import time
+from contextlib import contextmanager
+from typing import Tuple
+
+from ultralytics import YOLO
+
+from backends import DEFAULT_EXPORT_CACHE_DIR, InferenceBackend, StubBackend, check_parity, load_backend
+from model_store import DEFAULT_ARTIFACT_CACHE_DIR, fetch_model_artifact
+
+
+@contextmanager
+def timed(stage: str):
+    """Logs how long a replica startup stage took, to track cold-start regressions"""
+    start = time.perf_counter()
+    yield
+    print(f"⏱️  {stage}: {time.perf_counter() - start:.2f}s")
+
+
+def load_detection_model(artifact_name: str, project: str, entity: str, imgsz: int = 640, batch_size: int = 8,
+                         offline: bool = False, stub: bool = False, fallback: bool = False) -> Tuple[InferenceBackend, str]:
+    """Returns (backend, artifact_version) for a W&B model artifact"""
+    # DETECT_STUB_MODEL=1 serves fixed detections without weights, W&B or network
+    # access, for benchmarking the serving path offline (stub=True)
+    if stub:
+        print("🧪 Stub model mode, no model is loaded")
+        backend = StubBackend(
+            imgsz,
+            batch_latency_s=float(os.getenv("DETECT_STUB_BATCH_LATENCY_MS", "20")) / 1000,
+            image_latency_s=float(os.getenv("DETECT_STUB_IMAGE_LATENCY_MS", "5")) / 1000,
+        )
+        return backend, "stub"
+
+    # Artifacts come from a node-local cache shared by all replicas, keyed by
+    # artifact name and digest. With DETECT_OFFLINE=1 the cached copy is used
+    # without any W&B calls (offline=True)
+    try:
+        with timed("Model artifact"):
+            model_file, artifact_version = fetch_model_artifact(
+                artifact_name,
+                project=project,
+                entity=entity,
+                cache_dir=os.getenv("DETECT_ARTIFACT_CACHE_DIR", DEFAULT_ARTIFACT_CACHE_DIR),
+                offline=offline,
+            )
+        print(f"📁 Model file path: {model_file}")
+        with timed("Model load"):
+            model = YOLO(model_file)
+        print("✅ Model successfully loaded from wandb!")
+
+    except Exception as e:
+        print(f"❌ Failed to load model from wandb: {e}")
+        if not fallback:
+            raise
+        print("🔄 Switching to fallback model yolov8n.pt...")
+        model = YOLO('yolov8n.pt')
+        artifact_version = "yolov8n.pt"
+        print("✅ Fallback model successfully loaded!")
+
+    with timed("Backend setup"):
+        return select_backend(model, artifact_version, imgsz, batch_size), artifact_version
+
+
+def select_backend(model: YOLO, artifact_version: str, imgsz: int = 640, batch_size: int = 8) -> InferenceBackend:
+    """Wraps model in the runtime chosen with DETECT_BACKEND and DETECT_PRECISION"""
+    # DETECT_BACKEND selects the CPU runtime (pytorch, onnx, openvino, torchscript)
+    # and DETECT_PRECISION its weights (fp32, fp16, int8). Exported models are
+    # cached on disk per artifact, so only the first replica pays for the export
+    backend_name = os.getenv("DETECT_BACKEND", "pytorch")
+    precision = os.getenv("DETECT_PRECISION", "fp32")
+    reference = InferenceBackend(model, "pytorch", "fp32", imgsz)
+    backend = reference
+
+    if backend_name != "pytorch" or precision != "fp32":
+        try:
+            backend = load_backend(
+                model.ckpt_path,
+                artifact_version,
+                backend=backend_name,
+                precision=precision,
+                imgsz=imgsz,
+                batch_size=batch_size,
+                cache_dir=os.getenv("DETECT_EXPORT_CACHE_DIR", DEFAULT_EXPORT_CACHE_DIR),
+            )
+            print(f"✅ {backend_name} backend ({precision}) loaded!")
+
+            # DETECT_PARITY_CHECK: "warn" logs mismatches against PyTorch output,
+            # "strict" also falls back to PyTorch, "off" skips the check
+            parity_check = os.getenv("DETECT_PARITY_CHECK", "warn")
+            if parity_check != "off":
+                min_iou = float(os.getenv("DETECT_PARITY_MIN_IOU", "0.9"))
+                if not check_parity(reference, backend, min_iou) and parity_check == "strict":
+                    raise ValueError("parity check against PyTorch failed")
+        except Exception as e:
+            print(f"❌ Failed to load {backend_name} backend: {e}")
+            print("🔄 Switching to the PyTorch backend...")
+            backend = reference
+
+    return backend
@@ -0,0 +1,104 @@
+"""
+Node-local cache of W&B model artifacts for the object detection deployment
+Artifacts are stored by name and content digest, so replicas on the same node
+share one download and restart without touching the network
+"""
+
+import json
+import os
+import time
+from pathlib import Path
+from typing import Tuple
+
+from filelock import FileLock
+
+from disk_cache import COMPLETE_MARKER, materialize_once
+
+DEFAULT_ARTIFACT_CACHE_DIR = os.path.join(Path.home(), ".cache", "ml-ops-project", "artifacts")
+
+INDEX_FILE = "index.json"
+
+
+def fetch_model_artifact(artifact_name: str, project: str, entity: str,
+                         cache_dir: str = DEFAULT_ARTIFACT_CACHE_DIR, offline: bool = False) -> Tuple[str, str]:
+    """Returns (model_file, model_version) for a W&B model artifact, downloading it at most once per node"""
+    cache_root = Path(cache_dir)
+    cache_root.mkdir(parents=True, exist_ok=True)
+
+    if offline:
+        # No W&B calls at all: the alias is resolved from the last recorded download
+        entry = _read_index(cache_root).get(artifact_name)
+        if entry is None or not (Path(entry["path"]) / COMPLETE_MARKER).exists():
+            raise FileNotFoundError(f"Artifact {artifact_name} is not in the local cache {cache_root}")
+        print(f"📴 Offline mode, using cached artifact {entry['name']} ({entry['digest'][:12]})")
+        return _find_model_file(entry["path"]), f"{entry['name']}@{entry['digest']}"
+
+    if not os.getenv("WANDB_API_KEY"):
+        raise ValueError("WANDB_API_KEY not found in environment variables")
+
+    import wandb
+
+    # Resolving the alias is a single API call, no W&B run is created
+    start = time.perf_counter()
+    api = wandb.Api(overrides={"project": project, "entity": entity})
+    artifact = api.artifact(artifact_name, type="model")
+    print(f"⏱️  Resolved {artifact.name} ({artifact.digest[:12]}) in {time.perf_counter() - start:.2f}s")
+
+    artifact_dir = cache_root / safe_name(artifact.name.split(":")[0]) / artifact.digest
+
+    def download(tmp_dir):
+        start = time.perf_counter()
+        print(f"📥 Downloading model artifact: {artifact.name}")
+        artifact.download(root=str(tmp_dir))
+        print(f"⏱️  Downloaded artifact in {time.perf_counter() - start:.2f}s")
+
+    # Replicas starting together wait for the first one instead of downloading again
+    if materialize_once(artifact_dir, download):
+        print(f"⚡ Artifact cache hit: {artifact_dir}")
+
+    _update_index(cache_root, artifact_name, {
+        "name": artifact.name,
+        "digest": artifact.digest,
+        "path": str(artifact_dir),
+    })
+    return _find_model_file(artifact_dir), f"{artifact.name}@{artifact.digest}"
+
+
+def resolve_artifact_version(artifact_name: str, project: str, entity: str) -> str:
+    """Returns the model_version an artifact name or alias currently points to, without downloading it"""
+    import wandb
+
+    api = wandb.Api(overrides={"project": project, "entity": entity})
+    artifact = api.artifact(artifact_name, type="model")
+    return f"{artifact.name}@{artifact.digest}"
+
+
+def _find_model_file(artifact_dir) -> str:
+    for file in sorted(os.listdir(artifact_dir)):
+        if file.endswith('.pt'):
+            return os.path.join(artifact_dir, file)
+    raise FileNotFoundError("No .pt model file found in the downloaded artifact")
+
+
+def _read_index(cache_root: Path) -> dict:
+    index_path = cache_root / INDEX_FILE
+    if not index_path.exists():
+        return {}
+    with open(index_path, "r") as f:
+        return json.load(f)
+
+
+def _update_index(cache_root: Path, artifact_name: str, entry: dict):
+    """Records which digest an artifact name (alias) resolved to, for offline starts"""
+    with FileLock(str(cache_root / INDEX_FILE) + ".lock"):
+        index = _read_index(cache_root)
+        index[artifact_name] = entry
+        tmp_path = cache_root / f"{INDEX_FILE}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(index, f, indent=2)
+        os.replace(tmp_path, cache_root / INDEX_FILE)
+
+
+def safe_name(name: str) -> str:
+    """Turns an artifact or model version name into a single path component"""
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in name)
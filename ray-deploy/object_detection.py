@@ -1,16 +1,47 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from fastapi.responses import JSONResponse
-from fastapi import FastAPI
-from ultralytics import YOLO
+from functools import partial
+from fastapi import FastAPI, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from starlette.datastructures import UploadFile
+from typing import List, Optional
+import asyncio
+import httpx
+import numpy as np
 import os
-import wandb
+import time
+import torch
 
 from ray import serve
+from ray.serve.exceptions import BackPressureError
 from ray.serve.handle import DeploymentHandle
 
+from admission import (
+    AdmissionController, Deadline, DeadlineExceededError, OverloadedError, autoscaling_config, resolve_deadline,
+)
+from cpu_topology import ModelInstancePool, configure_process_threads, cpu_layout
+from backends import InferenceBackend
+from preprocessing import PreparedImage, decode_image, letterbox, scale_boxes
+from metrics import Metrics, start_metrics_server
+from model_loader import load_detection_model, timed
+from model_store import resolve_artifact_version
+from responses import FORMATS, check_format, encode_message, render, render_many, to_payload
+from result_cache import ResultCache, content_hash
+from tiling import Tile, TileConfig, check_tile_config, make_tiles, merge_tiles
+
 app = FastAPI()
 
+# Stream frames go to inference at most one replica batch at a time, and at most a
+# few batches may wait, so a client cannot make the ingress buffer unbounded frames
+STREAM_MAX_BATCH_SIZE = int(os.getenv("DETECT_MAX_BATCH_SIZE", "8"))
+STREAM_MAX_PENDING = 4 * STREAM_MAX_BATCH_SIZE
+
+
 @serve.deployment(
     num_replicas=1,
+    # The ingress only forwards requests, it must not cap concurrency below what
+    # the ObjectDetection replicas can batch
+    max_ongoing_requests=int(os.getenv("INGRESS_MAX_ONGOING_REQUESTS", "100")),
 )
 @serve.ingress(app)
 class APIIngress:
@@ -18,15 +49,217 @@ class APIIngress:
         self.handle: DeploymentHandle = object_detection_handle.options(
             use_new_handle_api=True,
         )
+        self.metrics = Metrics()
+        start_metrics_server(int(os.getenv("DETECT_METRICS_PORT", "9464")))
+        self.default_timeout_ms = float(os.getenv("DETECT_REQUEST_TIMEOUT_MS", "30000"))
+
+    def request_deadline(self, request: Request) -> float:
+        # Clients set their own budget with X-Request-Timeout-Ms; work still queued
+        # when it runs out is dropped instead of computed for nobody
+        header = request.headers.get("x-request-timeout-ms")
+        if header is None:
+            return time.time() + self.default_timeout_ms / 1000
+        try:
+            timeout_ms = float(header)
+        except ValueError:
+            timeout_ms = None
+        # Also rejects nan and inf, which compare false against every bound
+        if timeout_ms is None or not 0 < timeout_ms < float("inf"):
+            raise HTTPException(
+                status_code=400, detail=f"X-Request-Timeout-Ms must be a positive number of milliseconds, got '{header}'"
+            )
+        return time.time() + timeout_ms / 1000
+
+    async def call_detection(self, method, *args):
+        try:
+            return await method.remote(*args)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except OverloadedError as e:
+            self.metrics.count_error("overloaded")
+            raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+        except BackPressureError as e:
+            self.metrics.count_error("backpressure")
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+        except DeadlineExceededError as e:
+            self.metrics.count_error("deadline")
+            raise HTTPException(status_code=504, detail=str(e))
+
+    def tile_config(self, tile_size: Optional[int], tile_overlap: float) -> Optional[TileConfig]:
+        # Tiled mode is opt-in: slicing a large image into tile_size tiles keeps small
+        # objects that downscaling the whole image to the model input would lose
+        if tile_size is None:
+            return None
+        try:
+            check_tile_config(tile_size, tile_overlap)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return TileConfig(tile_size, tile_overlap)
 
     @app.get("/detect")
-    async def detect(self, image_url: str):
-        result = await self.handle.detect.remote(image_url)
-        return JSONResponse(content=result)
+    async def detect(
+        self,
+        request: Request,
+        image_url: str,
+        response_format: str = Query("json", alias="format"),
+        tile_size: Optional[int] = None,
+        tile_overlap: float = 0.2,
+    ):
+        check_format(response_format)
+        tiling = self.tile_config(tile_size, tile_overlap)
+        result = await self.call_detection(self.handle.detect, image_url, self.request_deadline(request), tiling)
+        with self.metrics.time_stage("serialization"):
+            return render(result, response_format)
+
+    @app.post("/detect")
+    async def detect_upload(
+        self,
+        request: Request,
+        response_format: str = Query("json", alias="format"),
+        tile_size: Optional[int] = None,
+        tile_overlap: float = 0.2,
+    ):
+        # Accepts either a raw JPEG/PNG request body or a multipart form. In a form,
+        # a single file (e.g. field "image") returns one result, files sent under the
+        # "images" field return {"results": [...]} in upload order
+        check_format(response_format)
+        tiling = self.tile_config(tile_size, tile_overlap)
+        deadline = self.request_deadline(request)
+        content_type = request.headers.get("content-type", "")
+        if content_type.startswith("multipart/form-data"):
+            form = await request.form()
+            batch = [upload for upload in form.getlist("images") if isinstance(upload, UploadFile)]
+            if batch:
+                images = [await upload.read() for upload in batch]
+                results = await asyncio.gather(
+                    *(self.call_detection(self.handle.detect_bytes, image, deadline, tiling) for image in images)
+                )
+                with self.metrics.time_stage("serialization"):
+                    return render_many(list(results), response_format)
+
+            upload = next((value for _, value in form.multi_items() if isinstance(value, UploadFile)), None)
+            if upload is None:
+                raise HTTPException(status_code=400, detail="No image file found in the form")
+            image_bytes = await upload.read()
+        else:
+            image_bytes = await request.body()
+
+        if not image_bytes:
+            raise HTTPException(status_code=400, detail="Request body is empty")
+        result = await self.call_detection(self.handle.detect_bytes, image_bytes, deadline, tiling)
+        with self.metrics.time_stage("serialization"):
+            return render(result, response_format)
+
+    @app.websocket("/detect/stream")
+    async def detect_stream(
+        self,
+        websocket: WebSocket,
+        response_format: str = Query("json", alias="format"),
+        max_pending: int = Query(4, ge=1, le=STREAM_MAX_PENDING),
+        max_batch_size: int = Query(min(8, STREAM_MAX_BATCH_SIZE), ge=1, le=STREAM_MAX_BATCH_SIZE),
+    ):
+        # Each binary message is one encoded frame (JPEG/PNG); every frame gets one
+        # message back, {"frame": index, ...detections} or {"frame": index, "status": "dropped"}.
+        # At most max_pending frames wait for inference; when the client sends faster
+        # than the replica keeps up, the oldest waiting frames are dropped so results
+        # stay close to real time
+        await websocket.accept()
+        if response_format not in FORMATS:
+            await websocket.close(code=1003, reason=f"Unknown format '{response_format}'")
+            return
+
+        pending = deque()
+        dropped = []
+        frames_available = asyncio.Event()
+        receiving = True
+
+        async def receive_frames():
+            nonlocal receiving
+            index = 0
+            try:
+                while True:
+                    message = await websocket.receive()
+                    if message["type"] == "websocket.disconnect":
+                        break
+                    if message.get("bytes") is None:
+                        continue
+                    if len(pending) >= max_pending:
+                        dropped.append(pending.popleft()[0])
+                    pending.append((index, message["bytes"]))
+                    index += 1
+                    frames_available.set()
+            finally:
+                receiving = False
+                frames_available.set()
+
+        async def send(payload: dict):
+            message = encode_message(payload, response_format)
+            if isinstance(message, bytes):
+                await websocket.send_bytes(message)
+            else:
+                await websocket.send_text(message)
+
+        receiver = asyncio.create_task(receive_frames())
+        try:
+            # A closed connection cannot receive results, so waiting frames are discarded
+            while receiving:
+                await frames_available.wait()
+                frames_available.clear()
+                while dropped:
+                    await send({"frame": dropped.pop(0), "status": "dropped"})
+                if not pending:
+                    continue
+
+                # Everything that queued up while the previous batch ran goes
+                # through inference together
+                batch = [pending.popleft() for _ in range(min(len(pending), max_batch_size))]
+                try:
+                    results = await self.handle.detect_frames.remote([frame for _, frame in batch])
+                except BackPressureError:
+                    # The frames are lost but the stream stays open, the client can slow down
+                    self.metrics.count_error("backpressure")
+                    for index, _ in batch:
+                        await send({"frame": index, "status": "overloaded"})
+                    if pending:
+                        frames_available.set()
+                    continue
+                for (index, _), result in zip(batch, results):
+                    if "overloaded" in result:
+                        self.metrics.count_error("overloaded")
+                        await send({"frame": index, "status": "overloaded"})
+                    elif "error" in result:
+                        await send({"frame": index, "status": "error", "detail": result["error"]})
+                    else:
+                        await send({"frame": index, **to_payload(result, response_format)})
+                if pending:
+                    frames_available.set()
+        except WebSocketDisconnect:
+            pass
+        finally:
+            receiver.cancel()
+
+    @app.get("/cache/stats")
+    async def cache_stats(self):
+        # Counters of the replica that handles this request
+        return JSONResponse(content=await self.handle.cache_stats.remote())
+
+    @app.get("/model")
+    async def model_info(self):
+        # Artifact and model version served by the replica that handles this request
+        return JSONResponse(content=await self.handle.model_info.remote())
 
 
 @serve.deployment(
-    autoscaling_config={"min_replicas": 1, "max_replicas": 2}
+    # Replica count follows ongoing requests per replica, targeted from the latency
+    # budget and observed batch latency (see admission.autoscaling_config)
+    autoscaling_config=autoscaling_config(),
+    # Must be at least DETECT_MAX_BATCH_SIZE, otherwise a replica never sees a full batch
+    max_ongoing_requests=int(os.getenv("DETECT_MAX_ONGOING_REQUESTS", "16")),
+    # Requests waiting for a free replica beyond this are rejected right away (HTTP 503)
+    max_queued_requests=int(os.getenv("DETECT_MAX_QUEUED_REQUESTS", "-1")),
+    # Reserve the CPUs the model instances actually use, so Ray packs replicas
+    # onto nodes without oversubscribing them
+    ray_actor_options={"num_cpus": cpu_layout().num_cpus},
 )
 class ObjectDetection:
     def __init__(self):
@@ -34,70 +267,357 @@ class ObjectDetection:
         self.wandb_project = os.getenv("WANDB_PROJECT", "ml-ops-project")
         self.wandb_entity = os.getenv("WANDB_ENTITY", "maslov-mykhailo-set-university") 
         self.model_artifact_name = os.getenv("WANDB_MODEL_ARTIFACT", "")
+
+        # Micro-batching configuration: concurrent requests are collected for up to
+        # DETECT_BATCH_WAIT_TIMEOUT_S seconds or DETECT_MAX_BATCH_SIZE images,
+        # whichever comes first, and run through the model in one forward pass
+        self.max_batch_size = int(os.getenv("DETECT_MAX_BATCH_SIZE", "8"))
+        self.batch_wait_timeout_s = float(os.getenv("DETECT_BATCH_WAIT_TIMEOUT_S", "0.02"))
+        self.detect_batch.set_max_batch_size(self.max_batch_size)
+        self.detect_batch.set_batch_wait_timeout_s(self.batch_wait_timeout_s)
+        print(f"📦 Batching: max_batch_size={self.max_batch_size}, batch_wait_timeout_s={self.batch_wait_timeout_s}")
+
+        # Pipeline stages: images are fetched on the event loop with a pooled async
+        # client, decoded and letterboxed in a bounded worker pool, and run through
+        # the model on a dedicated inference thread. The event loop is never blocked,
+        # so fetches for the next requests overlap with compute for the current batch
+        self.imgsz = int(os.getenv("DETECT_IMGSZ", "640"))
+        self.http_client = httpx.AsyncClient(
+            timeout=float(os.getenv("DETECT_FETCH_TIMEOUT_S", "10")),
+            limits=httpx.Limits(max_connections=int(os.getenv("DETECT_FETCH_MAX_CONNECTIONS", "32"))),
+            follow_redirects=True,
+        )
+        self.preprocess_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("DETECT_PREPROCESS_WORKERS", "2")),
+            thread_name_prefix="preprocess",
+        )
+
+        # Thread layout: DETECT_MODEL_INSTANCES model copies per replica, each on its
+        # own inference thread with DETECT_INTRA_OP_THREADS threads, optionally
+        # pinned to a core set (DETECT_PIN_CORES=1)
+        self.cpu_layout = cpu_layout()
+        configure_process_threads(self.cpu_layout)
+
+        # Per-stage latency, batch size, queue depth and error metrics in Prometheus
+        # format (and over OTLP when OTEL_EXPORTER_OTLP_ENDPOINT is set)
+        self.metrics = Metrics()
+        start_metrics_server(int(os.getenv("DETECT_METRICS_PORT", "9464")))
+
+        # Admission control: requests are rejected up front with 429 once
+        # DETECT_MAX_QUEUE_DEPTH images are queued (0 disables the limit), or with 504
+        # when the observed batch latency says their deadline cannot be met
+        self.admission = AdmissionController(
+            max_queue_depth=int(os.getenv("DETECT_MAX_QUEUE_DEPTH", "64")),
+            max_batch_size=self.max_batch_size,
+        )
+        print(f"🚦 Admission: max_queue_depth={self.admission.max_queue_depth}")
         
-        print("🤖 Initializing wandb and loading YOLO model...")
-        
-        # Ensure wandb is in online mode for artifact downloading
-        os.environ["WANDB_MODE"] = "online"
-        
-        # Initialize wandb
-        run = wandb.init(
+        # Warmup runs synthetic batches through every model instance before it serves,
+        # so the first real requests do not pay for lazy initialization. Serve only
+        # routes traffic to a replica once __init__ has returned, warm
+        sizes = os.getenv("DETECT_WARMUP_BATCH_SIZES", f"1,{self.max_batch_size}")
+        self.warmup_batch_sizes = [int(size) for size in sizes.split(",") if size.strip()]
+
+        print("🤖 Loading YOLO model...")
+        startup_start = time.perf_counter()
+        self.offline = os.getenv("DETECT_OFFLINE", "0") == "1" or os.getenv("WANDB_MODE") == "offline"
+        self.stub_model = os.getenv("DETECT_STUB_MODEL", "0") == "1"
+        backend, self.artifact_version = self.load_model(self.model_artifact_name, fallback=True)
+
+        self.instances = ModelInstancePool(self.cpu_layout)
+        with timed("Warmup"):
+            self.instances.activate(self.instances.prepare(backend, self.warmup))
+        self.backend = backend
+        # Different runtimes may produce slightly different boxes, cached results
+        # are kept apart per backend
+        self.model_version = f"{self.artifact_version}/{backend.name}-{backend.precision}"
+
+        # Hot-swap: a new artifact is loaded and warmed next to the serving one, then
+        # swapped in atomically. Triggered by user_config {"model_artifact": ...}
+        # (see reconfigure) or, every DETECT_MODEL_POLL_INTERVAL_S seconds, by the
+        # W&B alias moving to another version
+        self.swap_lock = asyncio.Lock()
+        self.model_poll_interval_s = float(os.getenv("DETECT_MODEL_POLL_INTERVAL_S", "0"))
+        if self.model_poll_interval_s > 0 and not self.stub_model and not self.offline:
+            self.poll_task = asyncio.get_running_loop().create_task(self.poll_model_alias())
+
+        # Tiled mode: DETECT_MAX_TILES caps the tiles per image, DETECT_TILE_IOU is the
+        # NMS threshold for merging detections across tiles
+        self.max_tiles = int(os.getenv("DETECT_MAX_TILES", "64"))
+        self.tile_iou = float(os.getenv("DETECT_TILE_IOU", "0.5"))
+
+        # Results are cached by image content hash under the loaded model version,
+        # so a different artifact never serves stale detections
+        self.result_cache = ResultCache(
+            max_entries=int(os.getenv("DETECT_CACHE_MAX_ENTRIES", "1024")),
+            ttl_s=float(os.getenv("DETECT_CACHE_TTL_S", "300")),
+            model_version=self.model_version,
+        )
+        print(f"🗄️  Result cache: {self.result_cache.max_entries} entries, ttl {self.result_cache.ttl_s}s")
+        print(f"⏱️  Replica ready in {time.perf_counter() - startup_start:.2f}s")
+
+    def load_model(self, artifact_name: str, fallback: bool = False):
+        """Returns (backend, artifact_version) for a W&B model artifact"""
+        return load_detection_model(
+            artifact_name,
             project=self.wandb_project,
             entity=self.wandb_entity,
-            job_type="inference",
-            mode="online"
+            imgsz=self.imgsz,
+            batch_size=self.max_batch_size,
+            offline=self.offline,
+            stub=self.stub_model,
+            fallback=fallback,
         )
-        
+
+    def warmup(self, backend: InferenceBackend):
+        for batch_size in self.warmup_batch_sizes:
+            batch = torch.rand((batch_size, 3, self.imgsz, self.imgsz), generator=torch.Generator().manual_seed(0))
+            backend.predict(batch)
+
+    async def reconfigure(self, config: dict):
+        # Serve user_config: {"model_artifact": "<name>:<alias or version>"}. Updating it
+        # with `serve deploy` reaches every replica without restarting them
+        artifact_name = config.get("model_artifact")
+        if artifact_name and artifact_name != self.model_artifact_name:
+            await self.swap_model(artifact_name)
+
+    async def poll_model_alias(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.model_poll_interval_s)
+            try:
+                version = await loop.run_in_executor(
+                    None, resolve_artifact_version, self.model_artifact_name, self.wandb_project, self.wandb_entity
+                )
+            except Exception as e:
+                print(f"⚠️  Could not resolve {self.model_artifact_name}: {e}")
+                continue
+            if version != self.artifact_version:
+                print(f"🔔 {self.model_artifact_name} now points to {version}")
+                await self.swap_model(self.model_artifact_name)
+
+    async def swap_model(self, artifact_name: str):
+        """Loads and warms artifact_name in the background, then switches every instance to it"""
+        async with self.swap_lock:
+            loop = asyncio.get_running_loop()
+            start = time.perf_counter()
+            try:
+                backend, artifact_version = await loop.run_in_executor(None, self.load_model, artifact_name)
+                if artifact_version == self.artifact_version:
+                    print(f"✅ {artifact_name} is already being served")
+                    self.model_artifact_name = artifact_name
+                    return
+                backends = await loop.run_in_executor(None, self.instances.prepare, backend, self.warmup)
+            except Exception as e:
+                # The current model keeps serving
+                print(f"❌ Failed to load {artifact_name}, still serving {self.model_version}: {e}")
+                self.metrics.count_error("model_swap")
+                return
+
+            # Batches already running finish on the old model, the next ones use the new
+            # one, and cached results of the old model are dropped
+            self.instances.activate(backends)
+            self.backend = backend
+            self.model_artifact_name = artifact_name
+            self.artifact_version = artifact_version
+            self.model_version = f"{artifact_version}/{backend.name}-{backend.precision}"
+            self.result_cache.set_model_version(self.model_version)
+            print(f"🔁 Now serving {self.model_version}, swapped in {time.perf_counter() - start:.2f}s")
+
+    def model_info(self):
+        batch_latency_s = self.admission.batch_latency_s
+        return {
+            "artifact": self.model_artifact_name,
+            "model_version": self.model_version,
+            # Measured value for DETECT_BATCH_LATENCY_MS (see admission.autoscaling_config)
+            "batch_latency_ms": round(batch_latency_s * 1000, 1) if batch_latency_s is not None else None,
+        }
+
+
+    async def detect(self, image_url: str, deadline: Optional[float] = None, tiling: Optional[TileConfig] = None):
+        self.admission.admit(self.metrics.queue_depth, deadline)
+        image_bytes = await self.fetch_image(image_url)
+        return await self.detect_bytes(image_bytes, deadline, tiling)
+
+    async def detect_bytes(self, image_bytes: bytes, deadline: Optional[float] = None,
+                           tiling: Optional[TileConfig] = None):
+        self.admission.admit(self.metrics.queue_depth, deadline)
+        # Identical images are served from the cache, and concurrent requests for
+        # the same image share one inference, run under the latest deadline of the
+        # requests waiting for it. Tiled results depend on the tiling
+        key = content_hash(image_bytes)
+        if tiling is not None:
+            key = f"{key}/tiles-{tiling.size}-{tiling.overlap}"
+        return await self.result_cache.get_or_compute(
+            key, partial(self.run_detection, image_bytes, tiling=tiling), deadline
+        )
+
+    async def run_detection(self, image_bytes: bytes, deadline: Deadline = None,
+                            tiling: Optional[TileConfig] = None):
+        # Bytes are decoded in place (np.frombuffer) straight into the letterboxed
+        # model input, no intermediate copies or temporary files
+        loop = asyncio.get_running_loop()
+        if tiling is None:
+            images = [await loop.run_in_executor(self.preprocess_executor, self.prepare_image, image_bytes)]
+        else:
+            tiles = await loop.run_in_executor(self.preprocess_executor, self.prepare_tiles, image_bytes, tiling)
+            images = [tile.image for tile in tiles]
+
+        # Fetching and decoding took part of the budget, check again before queueing
+        self.admission.check_deadline(deadline, self.metrics.queue_depth)
+        self.metrics.add_queue_depth(len(images))
         try:
-            # Check for API key presence
-            api_key = os.getenv("WANDB_API_KEY")
-            if not api_key:
-                raise ValueError("WANDB_API_KEY not found in environment variables")
-            
-            # Download model artifact from wandb
-            print(f"📥 Downloading model artifact: {self.model_artifact_name}")
-            artifact = run.use_artifact(self.model_artifact_name, type='model')
-            model_path = artifact.download()
-            
-            # Find model file in downloaded directory
-            model_file = None
-            for file in os.listdir(model_path):
-                if file.endswith('.pt'):
-                    model_file = os.path.join(model_path, file)
-                    break
-            
-            if model_file is None:
-                raise FileNotFoundError("No .pt model file found in the downloaded artifact")
-            
-            print(f"📁 Model file path: {model_file}")
-            self.model = YOLO(model_file)
-            print("✅ Model successfully loaded from wandb!")
-            
-        except Exception as e:
-            print(f"❌ Failed to load model from wandb: {e}")
-            print("🔄 Switching to fallback model yolov8n.pt...")
-            self.model = YOLO('yolov8n.pt')
-            print("✅ Fallback model successfully loaded!")
-        
+            # Tiles are enqueued together, so they share forward passes
+            detections = await asyncio.gather(*(self.detect_image(image, deadline) for image in images))
+        except DeadlineExceededError:
+            raise
+        except Exception:
+            self.metrics.count_error("inference")
+            raise
         finally:
-            # Finish wandb run after model loading
-            wandb.finish()
-
-    async def detect(self, image_url: str):
-        results = self.model(image_url)
-
-        detected_objects = []
-        if len(results) > 0:
-            for result in results:
-                for box in result.boxes:
-                    class_id = int(box.cls[0])
-                    object_name = result.names[class_id]
-                    coords = box.xyxy[0].tolist()
-                    detected_objects.append({"class": object_name, "coordinates": coords})
-
-        if len(detected_objects) > 0:
-            return {"status": "found", "objects": detected_objects}
+            self.metrics.add_queue_depth(-len(images))
+
+        # Class names come with the results, a batch that ran on the previous model
+        # during a hot-swap is still labeled correctly
+        names = detections[0][1]
+        if tiling is None:
+            data = detections[0][0]
         else:
-            return {"status": "not found"}
+            with self.metrics.time_stage("merge"):
+                data = merge_tiles([data for data, _ in detections], tiles, self.tile_iou)
+        with self.metrics.time_stage("postprocess"):
+            return self.format_detections(data, names)
+
+    async def detect_image(self, image: PreparedImage, deadline: Deadline):
+        result = await self.detect_batch(image, deadline)
+        if result is None:
+            raise DeadlineExceededError("Request deadline passed while waiting for a batch")
+        return await result
+
+    def prepare_image(self, image_bytes: bytes) -> PreparedImage:
+        image = self.decode(image_bytes)
+        with self.metrics.time_stage("preprocess"):
+            return letterbox(image, self.imgsz)
+
+    def prepare_tiles(self, image_bytes: bytes, tiling: TileConfig) -> List[Tile]:
+        image = self.decode(image_bytes)
+        with self.metrics.time_stage("preprocess"):
+            return make_tiles(image, tiling, self.imgsz, self.max_tiles)
+
+    def decode(self, image_bytes: bytes) -> np.ndarray:
+        try:
+            with self.metrics.time_stage("decode"):
+                return decode_image(image_bytes)
+        except ValueError:
+            self.metrics.count_error("decode")
+            raise
+
+    async def detect_frames(self, frames: List[bytes]):
+        # Stream frames go through the same admission control as /detect, counting
+        # the frames of this window admitted before them; a rejected frame is
+        # reported as overloaded without failing the others
+        admitted = []
+        results = [None] * len(frames)
+        for i, frame in enumerate(frames):
+            try:
+                self.admission.admit(self.metrics.queue_depth + len(admitted), None)
+                admitted.append(i)
+            except OverloadedError as e:
+                results[i] = {"overloaded": str(e)}
+
+        # Stream frames skip the result cache, they almost never repeat. They are
+        # enqueued together, so they share forward passes with each other and with
+        # concurrent requests. A frame that fails to decode does not fail the others
+        detections = await asyncio.gather(*(self.run_detection(frames[i]) for i in admitted), return_exceptions=True)
+        for i, result in zip(admitted, detections):
+            results[i] = {"error": str(result)} if isinstance(result, Exception) else result
+        return results
+
+    async def fetch_image(self, image_url: str) -> bytes:
+        try:
+            with self.metrics.time_stage("fetch"):
+                response = await self.http_client.get(image_url)
+                response.raise_for_status()
+        except httpx.HTTPError as e:
+            self.metrics.count_error("fetch")
+            raise ValueError(f"Failed to fetch image from {image_url}: {e}")
+        return response.content
+
+    def cache_stats(self):
+        return self.result_cache.stats()
+
+    @serve.batch(max_batch_size=8, batch_wait_timeout_s=0.02)
+    async def detect_batch(self, images: List[PreparedImage], deadlines: List[Deadline]):
+        # Batches are formed one at a time, so the handler only waits for a free model
+        # instance and hands the batch to it; every caller gets a future for its own
+        # result, and the next batch forms while this one runs
+        instance = await self.instances.acquire()
+
+        # Images whose deadline passed while queued are dropped from the forward pass
+        now = time.time()
+        deadlines = [resolve_deadline(deadline) for deadline in deadlines]
+        live = [i for i, deadline in enumerate(deadlines) if deadline is None or deadline > now]
+        outputs = [None] * len(images)
+        if not live:
+            self.instances.release(instance)
+            return outputs
+
+        loop = asyncio.get_running_loop()
+        futures = [loop.create_future() for _ in live]
+        asyncio.ensure_future(self.run_batch(instance, [images[i] for i in live], futures))
+        for i, future in zip(live, futures):
+            outputs[i] = future
+        return outputs
+
+    async def run_batch(self, instance: int, images: List[PreparedImage], futures: List[asyncio.Future]):
+        try:
+            results = await self.infer(instance, images)
+        except Exception as e:
+            results = [e] * len(images)
+        finally:
+            self.instances.release(instance)
+        for future, result in zip(futures, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def infer(self, instance: int, images: List[PreparedImage]):
+        self.metrics.observe_batch(len(images))
+        start = time.perf_counter()
+        results = await self.instances.run(instance, self.predict, images)
+        self.admission.observe_batch_latency(time.perf_counter() - start)
+
+        # Ultralytics reports per-image averages in milliseconds for the batch;
+        # postprocess is NMS, preprocessing already happened in the worker pool
+        speed = results[0].speed if results else {}
+        self.metrics.observe_stage("inference", speed.get("inference", 0) * len(images) / 1000)
+        self.metrics.observe_stage("nms", speed.get("postprocess", 0) * len(images) / 1000)
+
+        with self.metrics.time_stage("postprocess"):
+            return [(self.to_image_coordinates(result, image), result.names) for result, image in zip(results, images)]
+
+    def predict(self, backend: InferenceBackend, images: List[PreparedImage]):
+        # Images are already letterboxed to imgsz, so they stack into one BCHW
+        # tensor and go through a single forward pass
+        batch = torch.from_numpy(np.stack([image.tensor for image in images]))
+        return backend.predict(batch)
+
+    def to_image_coordinates(self, result, image: PreparedImage) -> np.ndarray:
+        # Whole-tensor post-processing: one copy of the (N, 6) [x1, y1, x2, y2, conf, cls]
+        # array per image, boxes mapped back in one operation, no per-box Python calls
+        data = result.boxes.data.cpu().numpy()
+        data[:, :4] = scale_boxes(data[:, :4], image)
+        return data
+
+    def format_detections(self, data: np.ndarray, names: dict):
+        class_ids = data[:, 5].astype(np.int64)
+        return {
+            "classes": [names[class_id] for class_id in class_ids.tolist()],
+            "scores": data[:, 4].tolist(),
+            "boxes": data[:, :4].tolist(),
+        }
 
 entrypoint = APIIngress.bind(ObjectDetection.bind())
\ No newline at end of file
@@ -0,0 +1,64 @@
+"""
+Image decoding and preprocessing for the object detection deployment
+Runs in a worker pool, so everything here must be safe to call from threads
+"""
+
+from typing import NamedTuple, Tuple
+
+import cv2
+import numpy as np
+
+# Same padding color Ultralytics uses for letterboxing
+PAD_VALUE = (114, 114, 114)
+
+
+class PreparedImage(NamedTuple):
+    """Letterboxed model input plus what is needed to map boxes back to the original image"""
+    tensor: np.ndarray          # CHW float32 RGB in [0, 1], imgsz x imgsz
+    scale: float                # resize ratio applied to the original image
+    pad: Tuple[float, float]    # (left, top) padding in model input pixels
+    shape: Tuple[int, int]      # (height, width) of the original image
+
+
+def decode_image(data) -> np.ndarray:
+    """Decodes encoded image bytes (JPEG, PNG, ...) into a BGR array"""
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    image = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("Could not decode image, expected JPEG or PNG data")
+    return image
+
+
+def letterbox(image: np.ndarray, imgsz: int) -> PreparedImage:
+    """Resizes keeping the aspect ratio and pads to a square imgsz x imgsz model input"""
+    height, width = image.shape[:2]
+    scale = min(imgsz / height, imgsz / width)
+    new_width, new_height = round(width * scale), round(height * scale)
+    if (new_width, new_height) != (width, height):
+        image = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+
+    pad_x = (imgsz - new_width) / 2
+    pad_y = (imgsz - new_height) / 2
+    top, bottom = int(round(pad_y - 0.1)), int(round(pad_y + 0.1))
+    left, right = int(round(pad_x - 0.1)), int(round(pad_x + 0.1))
+    image = cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=PAD_VALUE)
+
+    # BGR HWC uint8 -> RGB CHW float32 in [0, 1]
+    tensor = np.ascontiguousarray(image[..., ::-1].transpose(2, 0, 1), dtype=np.float32)
+    tensor *= 1 / 255
+    return PreparedImage(tensor, scale, (left, top), (height, width))
+
+
+def prepare_image(data, imgsz: int) -> PreparedImage:
+    """Decodes image bytes and turns them into a model input"""
+    return letterbox(decode_image(data), imgsz)
+
+
+def scale_boxes(boxes: np.ndarray, image: PreparedImage) -> np.ndarray:
+    """Maps xyxy boxes from model input coordinates back to the original image"""
+    left, top = image.pad
+    height, width = image.shape
+    boxes = (boxes - np.array([left, top, left, top], dtype=boxes.dtype)) / image.scale
+    boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, width)
+    boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, height)
+    return boxes
@@ -0,0 +1,64 @@
+"""
+Response formats for the detection API
+ObjectDetection replicas return detections as parallel arrays; the ingress turns
+them into the requested wire format with a fast encoder
+"""
+
+from typing import List, Union
+
+import msgpack
+import orjson
+from fastapi import HTTPException
+from fastapi.responses import ORJSONResponse, Response
+
+# json: the default {"status", "objects"} format
+# columnar: parallel "classes", "scores" and "boxes" arrays
+# msgpack: the columnar payload as binary msgpack
+FORMATS = ("json", "columnar", "msgpack")
+
+
+def check_format(response_format: str):
+    if response_format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format '{response_format}', expected one of {FORMATS}")
+
+
+def to_objects(detections: dict) -> dict:
+    if not detections["classes"]:
+        return {"status": "not found"}
+    objects = [
+        {"class": name, "confidence": score, "coordinates": box}
+        for name, score, box in zip(detections["classes"], detections["scores"], detections["boxes"])
+    ]
+    return {"status": "found", "objects": objects}
+
+
+def to_columnar(detections: dict) -> dict:
+    status = "found" if detections["classes"] else "not found"
+    return {"status": status, **detections}
+
+
+def to_payload(detections: dict, response_format: str = "json") -> dict:
+    return to_objects(detections) if response_format == "json" else to_columnar(detections)
+
+
+def render(detections: dict, response_format: str = "json") -> Response:
+    """Renders the detections of one image"""
+    return _encode(to_payload(detections, response_format), response_format)
+
+
+def render_many(detections: List[dict], response_format: str = "json") -> Response:
+    """Renders the detections of several images as {"results": [...]}"""
+    return _encode({"results": [to_payload(item, response_format) for item in detections]}, response_format)
+
+
+def encode_message(payload: dict, response_format: str = "json") -> Union[str, bytes]:
+    """Encodes a WebSocket message: binary frames for msgpack, text frames otherwise"""
+    if response_format == "msgpack":
+        return msgpack.packb(payload)
+    return orjson.dumps(payload).decode()
+
+
+def _encode(payload: dict, response_format: str) -> Response:
+    if response_format == "msgpack":
+        return Response(content=msgpack.packb(payload), media_type="application/msgpack")
+    return ORJSONResponse(content=payload)
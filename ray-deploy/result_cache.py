@@ -0,0 +1,142 @@
+"""
+In-memory detection result cache for the object detection deployment
+Entries are keyed by image content hash and model version, bounded by LRU size
+and TTL, and identical in-flight requests share a single computation. That
+computation runs under the latest deadline of the callers waiting for it, and
+every caller waits within its own deadline only
+"""
+
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+from admission import Deadline, DeadlineExceededError
+
+
+def content_hash(data) -> str:
+    """Returns the SHA-256 hex digest of encoded image bytes"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def later_deadline(deadline: Optional[float], other: Optional[float]) -> bool:
+    """Whether deadline leaves more time than other, None being no deadline at all"""
+    if deadline is None:
+        return other is not None
+    return other is not None and deadline > other
+
+
+class InFlight:
+    """A computation shared by concurrent callers, with the deadlines they are waiting under"""
+
+    def __init__(self, deadline: Optional[float]):
+        self.task: Optional[asyncio.Future] = None
+        # The deadline the computation last checked
+        self.deadline = deadline
+        self.waiters: List[Optional[float]] = []
+
+    def current_deadline(self) -> Optional[float]:
+        """Latest deadline among the waiting callers, None when one of them has none"""
+        if self.waiters:
+            self.deadline = None if None in self.waiters else max(self.waiters)
+        return self.deadline
+
+
+class ResultCache:
+    def __init__(self, max_entries: int = 1024, ttl_s: float = 300.0, model_version: str = ""):
+        # max_entries=0 disables storing results, in-flight coalescing still applies
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.model_version = model_version
+        self.entries: "OrderedDict[tuple, tuple]" = OrderedDict()  # key -> (expires_at, result)
+        self.in_flight: Dict[tuple, InFlight] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def set_model_version(self, model_version: str):
+        """Drops all cached results when the loaded model changes"""
+        if model_version == self.model_version:
+            return
+        self.model_version = model_version
+        self.entries.clear()
+        self.invalidations += 1
+
+    async def get_or_compute(self, key: Hashable, compute: Callable[[Deadline], Awaitable[Any]],
+                             deadline: Optional[float] = None):
+        """Returns a cached result for key, or runs compute(shared deadline) once for all concurrent callers
+
+        compute gets a callable returning the latest deadline of the waiting callers.
+        Each caller waits until its own deadline; a deadline failure of the shared
+        computation is only passed on to callers whose deadline is not later
+        """
+        key = (self.model_version, key)
+        entry = self.entries.get(key)
+        if entry is not None:
+            expires_at, result = entry
+            if expires_at > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return result
+            del self.entries[key]
+            self.evictions += 1
+
+        while True:
+            flight = self.in_flight.get(key)
+            if flight is not None:
+                self.coalesced += 1
+            else:
+                self.misses += 1
+                flight = InFlight(deadline)
+                # The computation runs as its own task, so a caller that gives up does
+                # not cancel the work other callers are waiting for
+                flight.task = asyncio.ensure_future(compute(flight.current_deadline))
+                self.in_flight[key] = flight
+                flight.task.add_done_callback(partial(self._on_done, key, flight))
+
+            timeout = None if deadline is None else deadline - time.time()
+            if timeout is not None and timeout <= 0:
+                raise DeadlineExceededError("Request deadline passed before inference")
+            flight.waiters.append(deadline)
+            try:
+                return await asyncio.wait_for(asyncio.shield(flight.task), timeout)
+            except asyncio.TimeoutError:
+                raise DeadlineExceededError("Request deadline passed while waiting for the result")
+            except DeadlineExceededError:
+                # Deadline failures are never cached or shared: the next caller starts over
+                if self.in_flight.get(key) is flight:
+                    del self.in_flight[key]
+                if not later_deadline(deadline, flight.deadline):
+                    raise
+            finally:
+                flight.waiters.remove(deadline)
+
+    def _on_done(self, key: tuple, flight: InFlight, task: asyncio.Future):
+        if self.in_flight.get(key) is flight:
+            del self.in_flight[key]
+        if task.cancelled() or task.exception() is not None:
+            return
+        # Results computed by a model that has since been replaced are not stored
+        if key[0] == self.model_version and self.max_entries > 0:
+            self.entries[key] = (time.monotonic() + self.ttl_s, task.result())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        return {
+            "model_version": self.model_version,
+            "entries": len(self.entries),
+            "in_flight": len(self.in_flight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
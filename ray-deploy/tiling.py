@@ -0,0 +1,83 @@
+"""
+Tiled (sliced) inference for high-resolution images
+The image is cut into overlapping tiles that each go through the model at full
+input resolution, so small objects survive; detections are mapped back to the
+original image and merged with class-aware NMS across tiles
+"""
+
+from typing import List, NamedTuple, Tuple
+
+import numpy as np
+import torch
+from torchvision.ops import batched_nms
+
+from preprocessing import PreparedImage, letterbox
+
+
+class TileConfig(NamedTuple):
+    size: int           # tile side in original image pixels
+    overlap: float      # fraction of the tile shared with its neighbour
+
+
+class Tile(NamedTuple):
+    image: PreparedImage
+    offset: Tuple[int, int]     # (x, y) of the tile's top-left corner in the original image
+
+
+def check_tile_config(size: int, overlap: float, max_size: int = 4096):
+    if not 32 <= size <= max_size:
+        raise ValueError(f"tile_size must be between 32 and {max_size}, got {size}")
+    if not 0 <= overlap < 1:
+        raise ValueError(f"tile_overlap must be in [0, 1), got {overlap}")
+
+
+def tile_origins(length: int, size: int, overlap: float) -> List[int]:
+    """Start positions along one axis; the last tile is aligned to the far edge"""
+    if length <= size:
+        return [0]
+    stride = max(1, int(size * (1 - overlap)))
+    origins = list(range(0, length - size, stride))
+    origins.append(length - size)
+    return origins
+
+
+def make_tiles(image: np.ndarray, config: TileConfig, imgsz: int, max_tiles: int) -> List[Tile]:
+    """Cuts a BGR image into letterboxed tiles, plus one view of the whole image for large objects"""
+    height, width = image.shape[:2]
+    xs = tile_origins(width, config.size, config.overlap)
+    ys = tile_origins(height, config.size, config.overlap)
+    if len(xs) * len(ys) > max_tiles:
+        raise ValueError(
+            f"Image needs {len(xs) * len(ys)} tiles of {config.size}px, at most {max_tiles} are allowed; "
+            f"use a larger tile_size or a smaller tile_overlap"
+        )
+
+    tiles = [Tile(letterbox(image, imgsz), (0, 0))]
+    if len(xs) * len(ys) > 1:
+        for y in ys:
+            for x in xs:
+                crop = image[y:y + config.size, x:x + config.size]
+                tiles.append(Tile(letterbox(crop, imgsz), (x, y)))
+    return tiles
+
+
+def merge_tiles(detections: List[np.ndarray], tiles: List[Tile], iou_threshold: float) -> np.ndarray:
+    """Shifts per-tile (N, 6) [x1, y1, x2, y2, conf, cls] detections into image coordinates and runs cross-tile NMS"""
+    shifted = []
+    for data, tile in zip(detections, tiles):
+        if len(data):
+            data = data.copy()
+            x, y = tile.offset
+            data[:, :4] += np.array([x, y, x, y], dtype=data.dtype)
+            shifted.append(data)
+    if not shifted:
+        return np.zeros((0, 6), dtype=np.float32)
+
+    merged = np.concatenate(shifted)
+    keep = batched_nms(
+        torch.from_numpy(merged[:, :4]),
+        torch.from_numpy(merged[:, 4]),
+        torch.from_numpy(merged[:, 5]).long(),
+        iou_threshold,
+    )
+    return merged[keep.numpy()]
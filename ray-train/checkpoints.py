@@ -0,0 +1,124 @@
+"""
+Durable training checkpoints and warm starts
+Rank 0 copies last.pt to `checkpoint.storage/<run_name>/` after every epoch, so
+a job resubmitted (or retried by Ray after a preemption) with the same run name
+resumes where it stopped. Warm start fine-tunes the deployed W&B model artifact
+on new data instead of training from config['model']
+"""
+
+import os
+import tempfile
+from pathlib import Path
+
+from disk_cache import materialize_once
+
+LAST_CHECKPOINT = "last.pt"
+# Written once training has finished, a run with it cannot be resumed
+COMPLETE_MARKER = "COMPLETE"
+
+LOCAL_DIR = os.path.join(tempfile.gettempdir(), "ml-ops-project")
+
+
+def checkpoint_uri(config, run_name):
+    storage = (config.get("checkpoint") or {}).get("storage")
+    return f"{storage.rstrip('/')}/{run_name}" if storage else None
+
+
+def _filesystem(uri):
+    import fsspec
+
+    return fsspec.core.url_to_fs(uri)
+
+
+def run_finished(config, run_name):
+    uri = checkpoint_uri(config, run_name)
+    if not uri:
+        return False
+    fs, path = _filesystem(uri)
+    return fs.exists(f"{path}/{COMPLETE_MARKER}")
+
+
+def fetch_checkpoint(config, run_name):
+    """Local copy of the run's latest checkpoint, or None when the run has none"""
+    uri = checkpoint_uri(config, run_name)
+    if not uri:
+        return None
+    fs, path = _filesystem(uri)
+    if not fs.exists(f"{path}/{LAST_CHECKPOINT}"):
+        return None
+    # One copy per process, Ray Train workers on a node fetch at the same time
+    local = Path(LOCAL_DIR) / "checkpoints" / run_name / str(os.getpid()) / LAST_CHECKPOINT
+    local.parent.mkdir(parents=True, exist_ok=True)
+    fs.get(f"{path}/{LAST_CHECKPOINT}", str(local))
+    return str(local)
+
+
+def fetch_deployed_model(config):
+    """Local weights file of warm_start.model_artifact, by default the latest model in model_registry"""
+    import wandb
+
+    artifact_name = config["warm_start"].get("model_artifact") or f"{config['model_registry']}:latest"
+    api = wandb.Api(overrides={"project": config["wandb_project"], "entity": os.getenv("WANDB_ENTITY")})
+    artifact = api.artifact(artifact_name, type="model")
+    artifact_dir = Path(LOCAL_DIR) / "warm-start" / artifact.digest
+    # Workers on the same node wait for the first download
+    materialize_once(artifact_dir, lambda tmp_dir: artifact.download(root=str(tmp_dir)))
+    for file in sorted(os.listdir(artifact_dir)):
+        if file.endswith(".pt"):
+            print(f"🔥 Warm start from {artifact.name} ({artifact.digest[:12]})")
+            return str(artifact_dir / file)
+    raise FileNotFoundError(f"No .pt model file found in artifact {artifact.name}")
+
+
+def start_args(config, run_name):
+    """Training arguments that pick the starting point: the run's checkpoint, the deployed model or config['model']"""
+    checkpoint = fetch_checkpoint(config, run_name)
+    if checkpoint:
+        print(f"🔁 Resuming {run_name} from {checkpoint_uri(config, run_name)}/{LAST_CHECKPOINT}")
+        return {"model": checkpoint, "resume": checkpoint}
+
+    warm_start = config.get("warm_start") or {}
+    if warm_start.get("enabled"):
+        # Fine-tuning on the full dataset would just be a slower retrain that forgets less
+        if not warm_start.get("data"):
+            raise ValueError("warm_start.data must name a dataset config with only the new data")
+        args = {"model": fetch_deployed_model(config)}
+        # Only the new data, with its own (usually shorter, gentler) schedule
+        for key in ("data", "epochs", "lr0"):
+            if warm_start.get(key) is not None:
+                args[key] = warm_start[key]
+        return args
+
+    return {"model": config["model"]}
+
+
+def checkpoint_callbacks(config, run_name):
+    """Ultralytics callbacks copying checkpoints to durable storage, empty without checkpoint.storage"""
+    uri = checkpoint_uri(config, run_name)
+    if not uri:
+        return {}
+
+    from ultralytics.utils import RANK
+
+    def upload(trainer, files):
+        if RANK not in {-1, 0}:
+            return
+        fs, path = _filesystem(uri)
+        fs.makedirs(path, exist_ok=True)
+        for file in files:
+            if file.exists():
+                fs.put(str(file), f"{path}/{file.name}")
+
+    def on_model_save(trainer):
+        upload(trainer, (trainer.last, trainer.best))
+        print(f"💾 Checkpoint for epoch {trainer.epoch + 1} saved to {uri}")
+
+    def on_train_end(trainer):
+        # last.pt on durable storage still has the optimizer state of the final
+        # epoch, the marker stops it from being resumed again
+        upload(trainer, (trainer.best,))
+        if RANK in {-1, 0}:
+            fs, path = _filesystem(uri)
+            fs.pipe(f"{path}/{COMPLETE_MARKER}", b"")
+
+    return {"on_model_save": on_model_save, "on_train_end": on_train_end}
@@ -0,0 +1,121 @@
+"""
+Node-local cache of the DVC-tracked training dataset
+The dataset version is the md5 of its .dvc file; files are read straight from
+the DVC remote (no git checkout or dvc pull needed on the node) into a cache
+directory keyed by that md5, so later jobs on the same node train without
+transferring any data
+"""
+
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import yaml
+
+from disk_cache import materialize_once
+
+DEFAULT_DATASET_CACHE_DIR = os.path.join(Path.home(), ".cache", "ml-ops-project", "datasets")
+
+# Ultralytics dataset config written next to the staged files
+DATA_YAML = "staged-data.yaml"
+
+
+def read_dvc_file(dvc_file):
+    """(md5, path) of the directory a .dvc file tracks"""
+    with open(dvc_file, "r") as f:
+        out = yaml.safe_load(f)["outs"][0]
+    return out["md5"], out["path"]
+
+
+def read_dvc_remote(dvc_config):
+    """URL of the default remote in a .dvc/config file"""
+    remotes, default, section = {}, None, None
+    with open(dvc_config, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("["):
+                section = line.strip("[]'")
+            elif "=" in line:
+                key, value = (part.strip() for part in line.split("=", 1))
+                if section == "core" and key == "remote":
+                    default = value
+                elif section and section.startswith("remote ") and key == "url":
+                    remotes[section.split('"')[1]] = value
+    if default not in remotes:
+        raise ValueError(f"No default DVC remote configured in {dvc_config}")
+    return remotes[default]
+
+
+def dataset_version(config):
+    """(md5, remote) of the dataset to stage, from the submitting machine or the local DVC files"""
+    settings = config.get("dataset") or {}
+    md5, remote = os.getenv("TRAIN_DATASET_MD5"), os.getenv("TRAIN_DATASET_REMOTE")
+    if md5 and remote:
+        return md5, remote
+    dvc_file = Path(settings.get("dvc_file", "../data/yolo.dvc"))
+    md5, _ = read_dvc_file(dvc_file)
+    return md5, read_dvc_remote(dvc_file.parent.parent / ".dvc" / "config")
+
+
+def _object_path(remote, md5):
+    # DVC 3 remote layout
+    return f"{remote.rstrip('/')}/files/md5/{md5[:2]}/{md5[2:]}"
+
+
+def _download(fs, remote, entry, target_dir):
+    target = target_dir / entry["relpath"]
+    target.parent.mkdir(parents=True, exist_ok=True)
+    fs.get(_object_path(remote, entry["md5"]), str(target))
+    with open(target, "rb") as f:
+        if hashlib.md5(f.read()).hexdigest() != entry["md5"]:
+            raise ValueError(f"Checksum mismatch for {entry['relpath']}")
+
+
+def stage_dataset(md5, remote, cache_dir=DEFAULT_DATASET_CACHE_DIR, download_workers=16):
+    """Returns the local directory holding the dataset version md5, downloading it at most once per node"""
+    import fsspec
+
+    dataset_dir = Path(cache_dir) / md5.replace(".dir", "")
+
+    def download(staging_dir):
+        start = time.perf_counter()
+        fs, _ = fsspec.core.url_to_fs(remote)
+        with fs.open(_object_path(remote, md5), "r") as f:
+            entries = json.load(f)
+        print(f"📥 Staging dataset {md5[:12]} ({len(entries)} files) from {remote}")
+        with ThreadPoolExecutor(max_workers=download_workers) as executor:
+            # list() surfaces the first failed download
+            list(executor.map(lambda entry: _download(fs, remote, entry, staging_dir), entries))
+        write_data_yaml(staging_dir, dataset_dir)
+        print(f"⏱️  Staged dataset in {time.perf_counter() - start:.2f}s")
+
+    # Workers starting together on one node wait for the first download
+    if materialize_once(dataset_dir, download):
+        print(f"⚡ Dataset cache hit: {dataset_dir}")
+    return dataset_dir
+
+
+def write_data_yaml(staging_dir, dataset_dir):
+    """Ultralytics dataset config for a Label Studio YOLO export (images/, labels/, classes.txt)"""
+    with open(staging_dir / "classes.txt", "r") as f:
+        names = [line.strip() for line in f if line.strip()]
+    with open(staging_dir / DATA_YAML, "w") as f:
+        yaml.safe_dump({
+            "path": str(dataset_dir),
+            "train": "images",
+            "val": "images",
+            "names": dict(enumerate(names)),
+        }, f)
+
+
+def resolve_data(config):
+    """Dataset config path to train on: the staged DVC dataset when enabled, config['data'] otherwise"""
+    settings = config.get("dataset") or {}
+    if not settings.get("enabled"):
+        return config["data"]
+    md5, remote = dataset_version(config)
+    cache_dir = settings.get("cache_dir") or os.getenv("TRAIN_DATASET_CACHE_DIR", DEFAULT_DATASET_CACHE_DIR)
+    return str(stage_dataset(md5, remote, cache_dir) / DATA_YAML)
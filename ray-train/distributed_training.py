@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Data-parallel YOLO training with Ray Train
+Runs one Ultralytics trainer per Ray Train worker on CPU, with gradients
+synchronized over a gloo process group; each worker trains on its shard of
+every epoch and only rank 0 validates, saves weights and logs to W&B
+"""
+
+import os
+from contextlib import contextmanager
+
+# W&B settings, the dataset version and the training environment forwarded to the workers
+FORWARDED_ENV_VARS = ("WANDB_API_KEY", "WANDB_PROJECT", "WANDB_ENTITY", "TRAIN_DATASET_MD5", "TRAIN_DATASET_REMOTE",
+                      "TRAIN_ENV_KEY", "TRAIN_ENV_CACHE_DIR")
+# Only the top-level code, configs and weights are shipped, not training
+# outputs, local environments or secrets
+WORKING_DIR_EXCLUDES = ["*/", ".env"]
+# Workers start through worker_env.py (run from the working directory), which
+# switches to the node's cached training virtualenv, building it on first use
+WORKER_PY_EXECUTABLE = "python worker_env.py"
+
+
+def init_ray(run_name, env_vars=None):
+    """Connects to the cluster, shipping the training code and W&B settings to every worker"""
+    import ray
+
+    if ray.is_initialized():
+        return
+    env_vars = {**{key: os.environ[key] for key in FORWARDED_ENV_VARS if os.getenv(key)}, **(env_vars or {})}
+    env_vars["WANDB_RUN_NAME"] = run_name
+    # The working directory holds this module, train_yolo.py and config.yaml,
+    # every worker imports them from there. Packages come from the same cached
+    # virtualenv the job itself runs in, not from a per-job pip environment
+    ray.init(address=os.getenv("RAY_ADDRESS", "auto"),
+             runtime_env={"working_dir": ".", "excludes": WORKING_DIR_EXCLUDES, "env_vars": env_vars,
+                          "py_executable": WORKER_PY_EXECUTABLE})
+
+
+def train_distributed(config, run_name):
+    """Trains on config['distributed']['num_workers'] Ray Train workers and returns rank 0's final metrics"""
+    from ray.train import RunConfig, ScalingConfig
+    from ray.train.torch import TorchConfig, TorchTrainer
+
+    settings = config.get("distributed") or {}
+    num_workers = int(settings.get("num_workers", 1))
+    cpus_per_worker = float(settings.get("cpus_per_worker", 2))
+
+    init_ray(run_name)
+    print(f"🌐 Distributed training on {num_workers} workers x {cpus_per_worker:g} CPUs")
+    trainer = TorchTrainer(
+        train_loop_per_worker,
+        train_loop_config={"config": config, "run_name": run_name},
+        torch_config=TorchConfig(backend="gloo"),
+        scaling_config=ScalingConfig(
+            num_workers=num_workers,
+            use_gpu=False,
+            resources_per_worker={"CPU": cpus_per_worker},
+            # SPREAD puts workers on different nodes, PACK fills one node first
+            placement_strategy=settings.get("placement_strategy", "SPREAD"),
+        ),
+        run_config=RunConfig(name=run_name, storage_path=settings.get("storage_path")),
+    )
+    result = trainer.fit()
+    return result.metrics
+
+
+def train_loop_per_worker(loop_config):
+    """Runs on every Ray Train worker"""
+    # Ray Train sets RANK, LOCAL_RANK and WORLD_SIZE right before calling this, and
+    # Ultralytics reads them once at import time, so it must only be imported here
+    import ray.train
+    from checkpoints import checkpoint_callbacks, start_args
+    from shard_cache import detection_trainer
+    from train_yolo import build_train_args, setup_wandb_environment
+    from training_profiler import profiler_callbacks
+
+    config, run_name = loop_config["config"], loop_config["run_name"]
+    rank = ray.train.get_context().get_world_rank()
+
+    # Ultralytics only registers logging callbacks on rank 0, the W&B login is only needed there
+    if rank == 0 and not setup_wandb_environment():
+        print("⚠️  Continuing without W&B logging")
+
+    # Every worker starts from its own copy of the run's checkpoint, rank 0 uploads new ones
+    train_args = {**build_train_args(config, run_name), **start_args(config, run_name)}
+    trainer = ray_detection_trainer(detection_trainer(config))(overrides=train_args)
+    for callbacks in (checkpoint_callbacks(config, run_name), profiler_callbacks(config)):
+        for event, callback in callbacks.items():
+            trainer.add_callback(event, callback)
+    trainer.train()
+
+    metrics = {}
+    if rank == 0 and trainer.metrics:
+        metrics = {key: float(value) for key, value in trainer.metrics.items()}
+        metrics["save_dir"] = str(trainer.save_dir)
+    # Every worker reports once, Ray Train keeps rank 0's metrics
+    ray.train.report(metrics)
+
+
+def ray_detection_trainer(base):
+    """Subclass of a DetectionTrainer class that joins the process group Ray Train created instead of launching its own DDP subprocesses"""
+    import torch.distributed as dist
+    from torch import nn
+
+    class CpuDistributedDataParallel(nn.parallel.DistributedDataParallel):
+        # Ultralytics passes device_ids=[RANK], which DDP only accepts for GPU modules
+        def __init__(self, module, device_ids=None, **kwargs):
+            super().__init__(module, device_ids=None, **kwargs)
+
+    @contextmanager
+    def cpu_ddp():
+        original = nn.parallel.DistributedDataParallel
+        nn.parallel.DistributedDataParallel = CpuDistributedDataParallel
+        try:
+            yield
+        finally:
+            nn.parallel.DistributedDataParallel = original
+
+    class RayDetectionTrainer(base):
+        def train(self):
+            # device="cpu" would make Ultralytics train single-process
+            self._do_train(dist.get_world_size())
+
+        def _setup_ddp(self, world_size):
+            # Ray Train already initialized the gloo process group on every worker
+            pass
+
+        def _setup_train(self, world_size):
+            with cpu_ddp():
+                super()._setup_train(world_size)
+
+    return RayDetectionTrainer
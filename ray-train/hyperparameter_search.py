@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Hyperparameter search for YOLO training with Ray Tune
+Samples the search spaces declared under `search.space` in config.yaml, trains
+the trials concurrently on the cluster, stops weak trials early based on the
+validation mAP reported after every epoch (ASHA or PBT), and logs the best
+trial's weights as the W&B model artifact that ray-deploy serves
+"""
+
+import json
+import shutil
+import tempfile
+from pathlib import Path
+
+from distributed_training import init_ray
+
+DEFAULT_METRIC = "metrics/mAP50-95(B)"
+# Written into every trial checkpoint next to the weights
+STATE_FILE = "state.json"
+# Ultralytics integrations whose job the search does itself: reporting to Tune
+# and one W&B run per trial
+TRIAL_SKIPPED_CALLBACKS = ("ultralytics.utils.callbacks.raytune", "ultralytics.utils.callbacks.wb")
+
+
+def build_search_space(space):
+    """Turns the `search.space` entries of config.yaml into Ray Tune domains"""
+    from ray import tune
+
+    samplers = {
+        "uniform": lambda spec: tune.uniform(spec["lower"], spec["upper"]),
+        "loguniform": lambda spec: tune.loguniform(spec["lower"], spec["upper"]),
+        "randint": lambda spec: tune.randint(spec["lower"], spec["upper"]),
+        "choice": lambda spec: tune.choice(spec["values"]),
+    }
+    domains = {}
+    for name, spec in (space or {}).items():
+        if spec.get("type") not in samplers:
+            raise ValueError(f"Unknown search space type for {name}: {spec.get('type')}, "
+                             f"expected one of {sorted(samplers)}")
+        domains[name] = samplers[spec["type"]](spec)
+    return domains
+
+
+def build_scheduler(settings, space, epochs):
+    """ASHA stops trials that fall behind; PBT also restarts them from the leaders' weights with mutated hyperparameters"""
+    from ray.tune.schedulers import ASHAScheduler, PopulationBasedTraining
+
+    scheduler = settings.get("scheduler", "asha").lower()
+    if scheduler == "asha":
+        return ASHAScheduler(
+            time_attr="epoch",
+            max_t=epochs,
+            grace_period=min(int(settings.get("grace_period", 1)), epochs),
+            reduction_factor=float(settings.get("reduction_factor", 3)),
+        )
+    if scheduler == "pbt":
+        return PopulationBasedTraining(
+            time_attr="epoch",
+            perturbation_interval=int(settings.get("perturbation_interval", 2)),
+            hyperparam_mutations=space,
+        )
+    raise ValueError(f"Unknown search scheduler: {scheduler}, expected 'asha' or 'pbt'")
+
+
+def train_trial(trial_config, config, run_name):
+    """Trains one sampled configuration, reporting metrics and weights to Tune after every epoch"""
+    # Imported on the trial worker only
+    from ray import tune
+    from shard_cache import detection_trainer
+    from train_yolo import build_train_args
+
+    context = tune.get_context()
+    trial_dir = Path(context.get_trial_dir())
+    trial_config = {**config, **trial_config, "device": "cpu"}
+
+    # PBT restarts a trial from another trial's latest weights
+    start_epoch, model = 0, config["model"]
+    checkpoint = tune.get_checkpoint()
+    if checkpoint:
+        with checkpoint.as_directory() as checkpoint_dir:
+            with open(Path(checkpoint_dir) / STATE_FILE, "r") as f:
+                start_epoch = json.load(f)["epoch"]
+            model = str(trial_dir / f"restored-{start_epoch}.pt")
+            shutil.copy2(Path(checkpoint_dir) / "last.pt", model)
+        print(f"🔁 Restored from epoch {start_epoch}")
+    if start_epoch >= config["epochs"]:
+        return
+
+    train_args = build_train_args(trial_config, run_name)
+    train_args.update({
+        "model": model,
+        "epochs": config["epochs"] - start_epoch,
+        "project": str(trial_dir),
+        "name": f"train-{start_epoch}",
+        "exist_ok": True,
+        "plots": False,
+    })
+    trainer = detection_trainer(config)(overrides=train_args)
+    for event, callbacks in trainer.callbacks.items():
+        trainer.callbacks[event] = [c for c in callbacks if c.__module__ not in TRIAL_SKIPPED_CALLBACKS]
+
+    def report_epoch(trainer):
+        epoch = start_epoch + trainer.epoch + 1
+        metrics = {key: float(value) for key, value in trainer.metrics.items()}
+        metrics["epoch"] = epoch
+        with tempfile.TemporaryDirectory() as checkpoint_dir:
+            for weights in (trainer.last, trainer.best):
+                if weights.exists():
+                    shutil.copy2(weights, checkpoint_dir)
+            with open(Path(checkpoint_dir) / STATE_FILE, "w") as f:
+                json.dump({"epoch": epoch}, f)
+            tune.report(metrics, checkpoint=tune.Checkpoint.from_directory(checkpoint_dir))
+
+    trainer.add_callback("on_fit_epoch_end", report_epoch)
+    trainer.train()
+
+
+def log_best_model(best, config, run_name, metric):
+    """Logs the best trial's weights as a W&B model artifact and links it to the registry ray-deploy serves from"""
+    import wandb
+
+    settings = config["search"]
+    artifact_name = settings.get("model_artifact", "yolo-detector")
+    run = wandb.init(project=config["wandb_project"], name=f"{run_name}-best", job_type="hpo",
+                     config={key: best.config[key] for key in settings["space"]})
+    artifact = wandb.Artifact(artifact_name, type="model", metadata={
+        "run_name": run_name,
+        "hyperparameters": {key: best.config[key] for key in settings["space"]},
+        metric: best.metrics[metric],
+        "epoch": best.metrics["epoch"],
+    })
+    with best.checkpoint.as_directory() as checkpoint_dir:
+        weights = Path(checkpoint_dir) / "best.pt"
+        if not weights.exists():
+            weights = Path(checkpoint_dir) / "last.pt"
+        artifact.add_file(str(weights), name="best.pt")
+        run.log_artifact(artifact, aliases=["latest", "hpo-best"])
+        # Upload before the checkpoint directory goes away
+        artifact.wait()
+    if config.get("model_registry"):
+        run.link_artifact(artifact, config["model_registry"], aliases=["hpo-best"])
+        print(f"🔗 Linked best weights to {config['model_registry']}")
+    run.finish()
+    print(f"📦 Logged best weights as W&B artifact {artifact_name}:latest")
+
+
+def run_search(config, run_name, log_to_wandb=True):
+    """Runs the search and returns the best trial's result"""
+    from ray import tune
+    from ray.tune import CheckpointConfig, RunConfig, TuneConfig, Tuner
+
+    settings = config["search"]
+    metric = settings.get("metric", DEFAULT_METRIC)
+    space = build_search_space(settings.get("space"))
+    if not space:
+        raise ValueError("search.space in config.yaml declares no hyperparameters")
+    max_concurrent = int(settings.get("max_concurrent_trials", 4))
+    cpus_per_trial = float(settings.get("cpus_per_trial", 4))
+
+    # Trials resolve config.yaml paths (data, model) from the shipped working directory
+    init_ray(run_name, env_vars={"RAY_CHDIR_TO_TRIAL_DIR": "0"})
+
+    callbacks = []
+    if log_to_wandb:
+        from ray.air.integrations.wandb import WandbLoggerCallback
+
+        # One W&B run per trial, grouped under the search
+        callbacks.append(WandbLoggerCallback(project=config["wandb_project"], group=run_name))
+
+    print(f"🔍 Searching {sorted(space)} with {settings.get('num_samples', 8)} trials, "
+          f"at most {max_concurrent} x {cpus_per_trial:g} CPUs at a time")
+    tuner = Tuner(
+        tune.with_resources(
+            tune.with_parameters(train_trial, config=config, run_name=run_name),
+            {"cpu": cpus_per_trial},
+        ),
+        param_space=space,
+        tune_config=TuneConfig(
+            metric=metric,
+            mode="max",
+            scheduler=build_scheduler(settings, space, config["epochs"]),
+            num_samples=int(settings.get("num_samples", 8)),
+            # Caps the cluster share of the search at max_concurrent x cpus_per_trial
+            max_concurrent_trials=max_concurrent,
+            time_budget_s=settings.get("time_budget_s"),
+        ),
+        run_config=RunConfig(
+            name=f"{run_name}-search",
+            storage_path=settings.get("storage_path"),
+            callbacks=callbacks,
+            # Only the latest weights of a trial are needed for PBT restarts and the final artifact
+            checkpoint_config=CheckpointConfig(num_to_keep=1),
+        ),
+    )
+    results = tuner.fit()
+
+    best = results.get_best_result(metric=metric, mode="max", scope="all")
+    hyperparameters = {key: best.config[key] for key in space}
+    print(f"🏆 Best trial: {metric}={best.metrics[metric]:.4f} with {hyperparameters}")
+    if log_to_wandb:
+        log_best_model(best, config, run_name, metric)
+    return best
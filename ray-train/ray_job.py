@@ -9,49 +9,24 @@ import sys
 import subprocess
 from pathlib import Path
 
-def install_system_dependencies():
-    """Installs system dependencies required for OpenCV"""
-    print("🔧 Installing system dependencies...")
-    try:
-        # Check if we have sudo access and if apt is available
-        result = subprocess.run(["which", "apt"], capture_output=True)
-        if result.returncode != 0:
-            print("⚠️  apt not found, skipping system dependencies")
-            return True
-        
-        # Install libgl1 and other OpenCV dependencies
-        result = subprocess.run(
-            "sudo apt update && sudo apt install -y libgl1-mesa-glx libglib2.0-0 libsm6 libxext6 libxrender-dev libgomp1",
-            shell=True, capture_output=True, text=True, check=True
-        )
-        print("✅ System dependencies installed successfully")
-        return True
-        
-    except subprocess.CalledProcessError as e:
-        print(f"⚠️  Failed to install system dependencies: {e}")
-        print("   This might cause OpenCV issues, but continuing...")
-        print(f"   STDERR: {e.stderr}")
-        return True  # Continue anyway as this might not be critical
-    except Exception as e:
-        print(f"⚠️  Error installing system dependencies: {e}")
-        return True  # Continue anyway
+from worker_env import prepare_environment
 
-def install_requirements():
-    """Installs Python requirements on the worker"""
-    print("📦 Installing Python requirements...")
+def prepare_worker_environment():
+    """Builds or reuses the cached training environment on this node"""
+    print("📦 Preparing training environment...")
     try:
-        subprocess.run([
-            sys.executable, "-m", "pip", "config", "--user", "set", "global.index-url", "https://pypi.org/simple/"
-        ])
-        result = subprocess.run([
-            sys.executable, "-m", "pip", "install", "-r", "requirements.txt"
-        ], capture_output=True, text=True, check=True)
-        print("✅ Python requirements installed successfully")
-        return True
+        python, report = prepare_environment()
     except subprocess.CalledProcessError as e:
-        print(f"❌ Failed to install Python requirements: {e}")
+        print(f"❌ Failed to build training environment: {e}")
         print(f"STDERR: {e.stderr}")
-        return False
+        return None
+
+    python_status = "cache hit" if report['python_cache_hit'] else "built"
+    system_status = "already installed" if report['system_cache_hit'] else "installed"
+    print(f"✅ Environment {report['key']}: Python packages {python_status} in {report['python_s']:.2f}s, "
+          f"system packages {system_status} in {report['system_s']:.2f}s")
+    print(f"⏱️  Environment setup took {report['total_s']:.2f}s")
+    return python
 
 def setup_environment():
     """Sets up environment variables on the worker"""
@@ -67,24 +42,12 @@ def setup_environment():
     print("✅ Environment file created")
     return True
 
-def run_yolo_training():
+def run_yolo_training(python):
     """Runs YOLO training on the worker"""
     print("🚀 Starting YOLO training...")
     try:
-        # Run training with real-time output
-        process = subprocess.Popen(
-            [sys.executable, "train_yolo.py"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            universal_newlines=True,
-            bufsize=1
-        )
-        
-        # Display output in real-time
-        for line in process.stdout:
-            print(line.strip())
-        
-        process.wait()
+        # Training writes straight to this job's output, no line-by-line relay
+        process = subprocess.run([python, "train_yolo.py"])
         
         if process.returncode == 0:
             print("✅ Training completed successfully")
@@ -109,27 +72,22 @@ def main():
         if file.is_file():
             print(f"  - {file.name}")
     
-    # Step 1: Install system dependencies
-    print("\n🔧 Step 1: Installing system dependencies...")
-    if not install_system_dependencies():
-        print("❌ Failed to install system dependencies")
-        sys.exit(1)
-    
-    # Step 2: Install Python dependencies
-    print("\n🔧 Step 2: Installing Python requirements...")
-    if not install_requirements():
-        print("❌ Failed to install Python requirements")
+    # Step 1: Prepare the cached environment
+    print("\n🔧 Step 1: Preparing environment...")
+    python = prepare_worker_environment()
+    if not python:
+        print("❌ Failed to prepare environment")
         sys.exit(1)
     
-    # Step 3: Set up environment
-    print("\n🔧 Step 3: Setting up environment...")
+    # Step 2: Set up environment
+    print("\n🔧 Step 2: Setting up environment...")
     if not setup_environment():
         print("❌ Failed to setup environment")
         sys.exit(1)
     
-    # Step 4: Run training
-    print("\n🔧 Step 4: Running YOLO training...")
-    if not run_yolo_training():
+    # Step 3: Run training
+    print("\n🔧 Step 3: Running YOLO training...")
+    if not run_yolo_training(python):
         print("❌ Training failed")
         sys.exit(1)
     
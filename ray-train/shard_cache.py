@@ -0,0 +1,234 @@
+"""
+Pre-decoded training images in memory-mapped shards
+Every image of a dataset split is decoded and resized once (long side to imgsz,
+like Ultralytics does on every load) and stored zero-padded in fixed-size
+imgsz x imgsz slots of .npy shards, next to its labels. Training reads the
+slots as copy-on-write memory-map views, so an epoch does no JPEG decoding or
+resizing while mosaic and the other augmentations still run on the fly.
+Shards are keyed by dataset version and imgsz and rebuilt only when either changes
+"""
+
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+
+from disk_cache import materialize_once
+
+DEFAULT_SHARD_CACHE_DIR = os.path.join(Path.home(), ".cache", "ml-ops-project", "shards")
+
+INDEX_FILE = "index.json"
+
+
+def dataset_version(img_path, im_files, label_files):
+    """Fingerprint of a dataset split: its path and image listing, plus the DVC hash of a staged dataset
+    or, without one, the size and mtime of every image and label file"""
+    digest = hashlib.sha256()
+    # Every split and dataset yaml gets its own shards, even within one DVC version
+    paths = img_path if isinstance(img_path, (list, tuple)) else [img_path]
+    digest.update("\n".join(str(path) for path in paths).encode())
+    digest.update("\n".join(sorted(im_files)).encode())
+    if os.getenv("TRAIN_DATASET_MD5"):
+        digest.update(os.environ["TRAIN_DATASET_MD5"].encode())
+    else:
+        for file in (*im_files, *label_files):
+            stat = os.stat(file) if os.path.exists(file) else None
+            digest.update((f"{file}:{stat.st_size}:{stat.st_mtime_ns}" if stat else f"{file}:-").encode())
+    return digest.hexdigest()
+
+
+def build_shards(img_path, imgsz, data, cache_dir=DEFAULT_SHARD_CACHE_DIR, shard_size=1024, workers=8):
+    """Returns the shard directory for a dataset split at imgsz, building it at most once per node"""
+    from ultralytics.data import YOLODataset
+    from ultralytics.data.utils import img2label_paths
+
+    # The same image listing training uses, without loading any labels
+    listed_files = YOLODataset.get_img_files(SimpleNamespace(prefix="shards: ", fraction=1.0), img_path)
+    key = hashlib.sha256(
+        f"{dataset_version(img_path, listed_files, img2label_paths(listed_files))}:{imgsz}".encode()
+    ).hexdigest()[:16]
+    shard_dir = Path(cache_dir) / key
+
+    def build(tmp_dir):
+        start = time.perf_counter()
+        # Verifies the images and labels the way training does, corrupt images are left out
+        source = YOLODataset(img_path=img_path, imgsz=imgsz, augment=False, data=data, prefix="shards: ")
+        im_files = source.im_files
+        print(f"🧱 Building {len(im_files)} images into shards of {shard_size} at {imgsz}px: {shard_dir}")
+
+        channels = source.channels
+        # Original height and width, resized height and width
+        shapes = np.zeros((len(im_files), 4), dtype=np.int32)
+        for first in range(0, len(im_files), shard_size):
+            count = min(shard_size, len(im_files) - first)
+            shard = np.lib.format.open_memmap(
+                tmp_dir / f"images-{first // shard_size:04d}.npy", mode="w+",
+                dtype=np.uint8, shape=(count, imgsz, imgsz, channels),
+            )
+
+            def store(i):
+                # cv2 releases the GIL, decoding runs in parallel
+                im, (h0, w0), (h, w) = source.load_image(first + i)
+                shard[i, :h, :w] = im.reshape(h, w, channels)
+                shapes[first + i] = (h0, w0, h, w)
+
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                list(executor.map(store, range(count)))
+            shard.flush()
+            del shard
+
+        # Labels of all images concatenated, with per-image offsets
+        labels = source.labels
+        offsets = np.cumsum([0] + [len(label["cls"]) for label in labels]).astype(np.int64)
+        boxes = np.concatenate(
+            [np.hstack([label["cls"].reshape(-1, 1), label["bboxes"].reshape(-1, 4)]) for label in labels]
+        ).astype(np.float32) if offsets[-1] else np.zeros((0, 5), dtype=np.float32)
+        np.save(tmp_dir / "shapes.npy", shapes)
+        np.save(tmp_dir / "labels.npy", boxes)
+        np.save(tmp_dir / "label_offsets.npy", offsets)
+        with open(tmp_dir / INDEX_FILE, "w") as f:
+            json.dump({
+                "im_files": im_files,
+                # Left out by verification, the way Ultralytics itself drops them
+                "corrupt_files": sorted(set(listed_files) - set(im_files)),
+                "imgsz": imgsz,
+                "shard_size": shard_size,
+                "channels": channels,
+            }, f)
+        print(f"⏱️  Built shards in {time.perf_counter() - start:.2f}s")
+
+    # Ranks on the same node wait for the first build
+    if materialize_once(shard_dir, build):
+        print(f"⚡ Shard cache hit: {shard_dir}")
+    return shard_dir
+
+
+def shard_files(im_files, positions, corrupt_files):
+    """The requested images that are in the shards; raises when one is missing for any reason but corruption"""
+    missing = [file for file in im_files if file not in positions and file not in corrupt_files]
+    if missing:
+        raise FileNotFoundError(
+            f"{len(missing)} images are not in the shard index, rebuild the shards or check img_path: "
+            f"{', '.join(missing[:5])}{' ...' if len(missing) > 5 else ''}"
+        )
+    skipped = sum(1 for file in im_files if file not in positions)
+    if skipped:
+        print(f"⚠️  {skipped} corrupt images were left out of the shards")
+    return [file for file in im_files if file in positions]
+
+
+def sharded_dataset_class():
+    from ultralytics.data import YOLODataset
+
+    class ShardedDataset(YOLODataset):
+        """YOLODataset that reads images and labels from a shard directory instead of the image files"""
+
+        def __init__(self, shard_dir, *args, **kwargs):
+            self.shard_dir = Path(shard_dir)
+            with open(self.shard_dir / INDEX_FILE, "r") as f:
+                index = json.load(f)
+            self.shard_size = index["shard_size"]
+            self.positions = {file: i for i, file in enumerate(index["im_files"])}
+            self.corrupt_files = set(index.get("corrupt_files", []))
+            self.shard_shapes = np.load(self.shard_dir / "shapes.npy")
+            self._shards = None
+            super().__init__(*args, **kwargs)
+
+        @property
+        def shards(self):
+            # Opened lazily, so dataloader workers map the files instead of receiving pickled copies
+            if self._shards is None:
+                self._shards = [
+                    np.load(path, mmap_mode="c") for path in sorted(self.shard_dir.glob("images-*.npy"))
+                ]
+            return self._shards
+
+        def __getstate__(self):
+            state = self.__dict__.copy()
+            state["_shards"] = None
+            return state
+
+        def get_labels(self):
+            boxes = np.load(self.shard_dir / "labels.npy")
+            offsets = np.load(self.shard_dir / "label_offsets.npy")
+            self.im_files = shard_files(self.im_files, self.positions, self.corrupt_files)
+            labels = []
+            for file in self.im_files:
+                position = self.positions[file]
+                rows = boxes[offsets[position]:offsets[position + 1]]
+                labels.append({
+                    "im_file": file,
+                    "shape": tuple(int(v) for v in self.shard_shapes[position, :2]),
+                    "cls": rows[:, :1].copy(),
+                    "bboxes": rows[:, 1:].copy(),
+                    "segments": [],
+                    "keypoints": None,
+                    "normalized": True,
+                    "bbox_format": "xywh",
+                })
+            self.label_files = []
+            return labels
+
+        def load_image(self, i, rect_mode=True):
+            if not rect_mode:
+                # Stretched square resizes are not what the shards hold
+                return super().load_image(i, rect_mode)
+            position = self.positions[self.im_files[i]]
+            h0, w0, h, w = (int(v) for v in self.shard_shapes[position])
+            # Copy-on-write view: in-place augmentations never touch the shard file
+            im = self.shards[position // self.shard_size][position % self.shard_size, :h, :w]
+            if self.augment:
+                # Mosaic draws its extra images from this buffer
+                self.buffer.append(i)
+                if 1 < len(self.buffer) >= self.max_buffer_length:
+                    self.buffer.pop(0)
+            return im, (h0, w0), (h, w)
+
+    return ShardedDataset
+
+
+def detection_trainer(config, base=None):
+    """The trainer class for config: DetectionTrainer (or base) reading from shards when shard_cache is enabled"""
+    from ultralytics.models.yolo.detect import DetectionTrainer
+    from ultralytics.utils import RANK, colorstr
+    from ultralytics.utils.torch_utils import de_parallel
+
+    base = base or DetectionTrainer
+    settings = config.get("shard_cache") or {}
+    if not settings.get("enabled"):
+        return base
+    cache_dir = settings.get("cache_dir") or os.getenv("TRAIN_SHARD_CACHE_DIR", DEFAULT_SHARD_CACHE_DIR)
+    shard_size = int(settings.get("shard_size", 1024))
+
+    class ShardedDetectionTrainer(base):
+        def build_dataset(self, img_path, mode="train", batch=None):
+            shard_dir = build_shards(img_path, self.args.imgsz, self.data, cache_dir, shard_size)
+            gs = max(int(de_parallel(self.model).stride.max() if self.model else 0), 32)
+            if RANK in {-1, 0}:
+                print(f"📦 {mode} images from shards in {shard_dir}")
+            # Same arguments as Ultralytics' build_yolo_dataset, only the class differs
+            return sharded_dataset_class()(
+                shard_dir,
+                img_path=img_path,
+                imgsz=self.args.imgsz,
+                batch_size=batch,
+                augment=mode == "train",
+                hyp=self.args,
+                rect=self.args.rect or mode == "val",
+                cache=None,
+                single_cls=self.args.single_cls or False,
+                stride=gs,
+                pad=0.0 if mode == "train" else 0.5,
+                prefix=colorstr(f"{mode}: "),
+                task=self.args.task,
+                classes=self.args.classes,
+                data=self.data,
+                fraction=self.args.fraction if mode == "train" else 1.0,
+            )
+
+    return ShardedDetectionTrainer
@@ -5,12 +5,17 @@ Submits ray_job.py as a Ray task with file uploads
 """
 
 import os
+import argparse
 import ray
 import yaml
 import logging
 from pathlib import Path
 from datetime import datetime
 
+from dataset_cache import dataset_version
+from distributed_training import WORKING_DIR_EXCLUDES
+from worker_env import environment_key
+
 # Reduce Ray logging verbosity
 logging.getLogger("ray").setLevel(logging.WARNING)
 
@@ -37,7 +42,7 @@ def load_config(config_path="config.yaml"):
 
 def check_required_files():
     """Checks if all required files exist"""
-    required_files = ["train_yolo.py", "config.yaml", "requirements.txt", "ray_job.py"]
+    required_files = ["train_yolo.py", "distributed_training.py", "hyperparameter_search.py", "worker_env.py", "dataset_cache.py", "shard_cache.py", "checkpoints.py", "config.yaml", "requirements.txt", "ray_job.py"]
     missing_files = [f for f in required_files if not Path(f).exists()]
     
     if missing_files:
@@ -47,45 +52,15 @@ def check_required_files():
     print("✅ All required files found")
     return True
 
-def prepare_job_files():
-    """Prepares files for Ray job"""
-    files_to_upload = [
-        "train_yolo.py",
-        "config.yaml", 
-        "requirements.txt",
-        "ray_job.py"
-    ]
-
-    file_contents = {}
-    for file_name in files_to_upload:
-        if Path(file_name).exists():
-            with open(file_name, 'r') as f:
-                file_contents[file_name] = f.read()
-            print(f"  ✅ Prepared {file_name}")
-        else:
-            print(f"  ❌ Missing {file_name}")
-            return None
-    return file_contents
-
 @ray.remote
-def run_ray_job(file_contents):
-    """Runs ray_job.py on Ray worker with uploaded files"""
+def run_ray_job():
+    """Runs ray_job.py on Ray worker inside the shipped working directory"""
     import subprocess
     import sys
-    import tempfile
     import os
     
-    # Create temporary directory and write files
-    temp_dir = tempfile.mkdtemp()
-    os.chdir(temp_dir)
-    
-    # Write all files to worker
-    for filename, content in file_contents.items():
-        with open(filename, 'w') as f:
-            f.write(content)
-    
-    # Environment variables are now set through runtime_env
-    print("✅ Files uploaded and environment configured")
+    # Ray unpacks the working directory package and starts the task inside it
+    print(f"✅ Working directory ready: {os.getcwd()}")
     
     # Run ray_job.py
     try:
@@ -104,8 +79,23 @@ def run_ray_job(file_contents):
         print(f"STDERR: {e.stderr}")
         return False
 
+def dataset_env_vars(config):
+    """Version of the DVC dataset the job stages on its nodes"""
+    if not (config or {}).get('dataset', {}).get('enabled'):
+        return {}
+    md5, remote = dataset_version(config)
+    print(f"🗂️  Dataset version: {md5} from {remote}")
+    return {'TRAIN_DATASET_MD5': md5, 'TRAIN_DATASET_REMOTE': remote}
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Submit YOLO training to the Ray cluster')
+    parser.add_argument('--run-name', type=str, default=None,
+                        help='Run name to use as is; submitting an unfinished run again resumes it from its last checkpoint')
+    return parser.parse_args()
+
 def main():
     """Main function"""
+    args = parse_arguments()
     print("🚀 Ray Task Submission for YOLO Training")
     print("=" * 40)
     
@@ -147,12 +137,6 @@ def main():
         return
     
     try:
-        # Prepare files
-        print("📁 Preparing files...")
-        file_contents = prepare_job_files()
-        if not file_contents:
-            return
-        
         # Submit job
         print("🚀 Submitting ray_job.py as Ray task...")
         
@@ -160,15 +144,24 @@ def main():
         config = load_config()
         base_run_name = config.get('run_name', 'yolo-ray-training') if config else 'yolo-ray-training'
         
-        # Generate dynamic run name with timestamp
+        # Generate dynamic run name with timestamp, unless resuming a named run
         timestamp = datetime.now().strftime('%Y%m%d-%H%M%S')
-        run_name = f"{base_run_name}-{timestamp}"
+        run_name = args.run_name or f"{base_run_name}-{timestamp}"
         
         # Prepare runtime environment with W&B variables
         env_vars = {k: v for k, v in wandb_env.items() if v}  # Only non-empty values
         env_vars['WANDB_RUN_NAME'] = run_name  # Add dynamic run name
+        # Nodes reuse a prebuilt environment with the same key
+        env_vars['TRAIN_ENV_KEY'] = environment_key()
+        print(f"📦 Training environment: {env_vars['TRAIN_ENV_KEY']}")
+        
+        env_vars.update(dataset_env_vars(config))
         
+        # Code and binary assets are uploaded once as a content-addressed package,
+        # an unchanged directory is not uploaded again
         runtime_env = {
+            "working_dir": ".",
+            "excludes": WORKING_DIR_EXCLUDES,
             "env_vars": env_vars
         }
         
@@ -185,7 +178,9 @@ def main():
             print("   Make sure .env file exists or variables are exported")
         
         # Submit task with runtime environment
-        task = run_ray_job.options(runtime_env=runtime_env).remote(file_contents)
+        # A job whose node dies is rerun and resumes from its last durable checkpoint
+        max_retries = ((config or {}).get('checkpoint') or {}).get('max_retries', 3)
+        task = run_ray_job.options(runtime_env=runtime_env, max_retries=max_retries).remote()
         
         # Wait for completion
         print("👀 Waiting for task completion...")
@@ -12,6 +12,11 @@ from dotenv import load_dotenv
 from ultralytics import YOLO
 import torch
 
+from checkpoints import checkpoint_callbacks, run_finished, start_args
+from dataset_cache import resolve_data
+from shard_cache import detection_trainer
+from training_profiler import profiler_callbacks
+
 def load_config(config_path="config.yaml"):
     """Loads configuration from YAML file"""
     with open(config_path, 'r') as file:
@@ -45,22 +50,11 @@ def setup_wandb_environment():
         print(f"❌ Failed to setup W&B: {e}")
         return False
 
-def train_model(config):
-    """Trains YOLOv8n model with built-in W&B tracking"""
-    
-    # Override run_name with environment variable if set
-    run_name = os.getenv('WANDB_RUN_NAME', config['run_name'])
-    
-    print("🚀 Starting YOLOv8n training on CPU...")
-    print(f"📊 W&B Project: {config['wandb_project']}")
-    print(f"🏃 Run Name: {run_name}")
-    
-    # Initialize model
-    model = YOLO(config['model'])
-    
-    # Training parameters - YOLO will automatically handle W&B integration
-    train_args = {
-        'data': config['data'],
+def build_train_args(config, run_name):
+    """Ultralytics training arguments from the config"""
+    # YOLO will automatically handle W&B integration
+    return {
+        'data': resolve_data(config),
         'epochs': config['epochs'],
         'batch': config['batch'],
         'imgsz': config['imgsz'],
@@ -77,16 +71,69 @@ def train_model(config):
         'plots': True,
         'verbose': True
     }
+
+def train_model(config):
+    """Trains YOLOv8n model with built-in W&B tracking"""
+    
+    # Override run_name with environment variable if set
+    run_name = os.getenv('WANDB_RUN_NAME', config['run_name'])
+    
+    print("🚀 Starting YOLOv8n training on CPU...")
+    print(f"📊 W&B Project: {config['wandb_project']}")
+    print(f"🏃 Run Name: {run_name}")
+    
+    # Training parameters, starting from the run's last checkpoint when it has one
+    train_args = {**build_train_args(config, run_name), **start_args(config, run_name)}
+    
+    # Initialize model
+    model = YOLO(train_args.pop('model'))
+    # Profiler last, so checkpoint uploads count as saving time
+    for callbacks in (checkpoint_callbacks(config, run_name), profiler_callbacks(config)):
+        for event, callback in callbacks.items():
+            model.add_callback(event, callback)
     
     print(f"🔧 Training parameters: {train_args}")
     
     # Start training - YOLO will automatically log to W&B
-    results = model.train(**train_args)
+    results = model.train(trainer=detection_trainer(config), **train_args)
     
     print("✅ Training completed with built-in W&B logging!")
     
     return model, results
 
+def train_model_distributed(config):
+    """Trains across Ray Train workers, W&B logging comes from rank 0"""
+    from distributed_training import train_distributed
+
+    run_name = os.getenv('WANDB_RUN_NAME', config['run_name'])
+
+    print("🚀 Starting distributed YOLOv8n training on CPU...")
+    print(f"📊 W&B Project: {config['wandb_project']}")
+    print(f"🏃 Run Name: {run_name}")
+
+    metrics = train_distributed(config, run_name)
+
+    print(f"✅ Distributed training completed, final metrics: {metrics}")
+
+    return metrics
+
+def search_hyperparameters(config):
+    """Runs the Ray Tune search declared in config.yaml, the best weights go to W&B"""
+    from hyperparameter_search import run_search
+
+    run_name = os.getenv('WANDB_RUN_NAME', config['run_name'])
+
+    print("🚀 Starting YOLOv8n hyperparameter search on CPU...")
+    print(f"📊 W&B Project: {config['wandb_project']}")
+    print(f"🏃 Run Name: {run_name}")
+
+    # Trials log through Ray Tune, the driver only needs the W&B login
+    best = run_search(config, run_name, log_to_wandb=setup_wandb_environment())
+
+    print("✅ Hyperparameter search completed!")
+
+    return best
+
 def main():
     """Main training function"""
     print("=" * 60)
@@ -104,12 +151,24 @@ def main():
         # Force CPU usage as specified in requirements
         config['device'] = 'cpu'
         
-        # Set up W&B environment (login and enable YOLO integration)
-        if not setup_wandb_environment():
-            print("⚠️  Continuing without W&B logging")
+        run_name = os.getenv('WANDB_RUN_NAME', config['run_name'])
+        if run_finished(config, run_name):
+            raise ValueError(f"Run {run_name} has already finished, submit with a new run name to train again")
         
-        # Train model with built-in W&B integration
-        model, results = train_model(config)
+        num_workers = (config.get('distributed') or {}).get('num_workers', 1)
+        if (config.get('search') or {}).get('enabled'):
+            # Every trial trains in a single process, distributed settings do not apply
+            search_hyperparameters(config)
+        elif num_workers > 1:
+            # Each worker sets up W&B itself, only rank 0 logs
+            train_model_distributed(config)
+        else:
+            # Set up W&B environment (login and enable YOLO integration)
+            if not setup_wandb_environment():
+                print("⚠️  Continuing without W&B logging")
+            
+            # Train model with built-in W&B integration
+            model, results = train_model(config)
 
         wandb_entity = os.getenv('WANDB_ENTITY')
         wandb_project = os.getenv('WANDB_PROJECT')
@@ -0,0 +1,191 @@
+"""
+Per-epoch training throughput and phase timings
+Ultralytics callbacks that split every epoch into dataloader wait, compute
+(forward, backward and optimizer step), validation, saving and logging, and
+record images/sec and peak RSS of the trainer and its dataloader workers.
+Results go to W&B under profile/ and to <save_dir>/profile.json. One epoch can
+additionally be captured with py-spy (CPU flame graph) or memray (allocations)
+"""
+
+import json
+import os
+import signal
+import subprocess
+import time
+
+import psutil
+
+# Memory is sampled every this many batches, and at the end of the epoch
+RSS_SAMPLE_INTERVAL = 10
+
+
+def total_rss_mb():
+    """Current resident memory of this process plus its live children (dataloader workers)"""
+    # Pages forked workers still share with the parent are counted once per process
+    process = psutil.Process()
+    rss = process.memory_info().rss
+    for child in process.children(recursive=True):
+        try:
+            rss += child.memory_info().rss
+        except psutil.Error:
+            # Exited between listing and reading
+            pass
+    return rss / 1024 / 1024
+
+
+class EpochCapture:
+    """py-spy or memray recording of a single epoch, failures only cost the capture"""
+
+    def __init__(self, tool, save_dir, epoch):
+        self.tool = tool
+        self.epoch = epoch
+        self.process = None
+        self.tracker = None
+        if tool == "py-spy":
+            self.output = str(save_dir / f"py-spy-epoch{epoch}.svg")
+        elif tool == "memray":
+            self.output = str(save_dir / f"memray-epoch{epoch}.bin")
+        else:
+            raise ValueError(f"Unknown profiler capture: {tool}, expected 'py-spy' or 'memray'")
+
+    def start(self):
+        try:
+            if self.tool == "py-spy":
+                # Attaching to our own pid needs ptrace permission (CAP_SYS_PTRACE in containers)
+                self.process = subprocess.Popen(
+                    ["py-spy", "record", "--pid", str(os.getpid()), "--rate", "100",
+                     "--subprocesses", "--output", self.output],
+                    stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                )
+            else:
+                import memray
+
+                self.tracker = memray.Tracker(self.output)
+                self.tracker.__enter__()
+            print(f"🔬 Capturing epoch {self.epoch} with {self.tool}")
+        except Exception as e:
+            print(f"⚠️  Could not start {self.tool}: {e}")
+            self.process = self.tracker = None
+
+    def stop(self):
+        try:
+            if self.process is not None:
+                # py-spy writes the flame graph when interrupted
+                self.process.send_signal(signal.SIGINT)
+                _, stderr = self.process.communicate(timeout=60)
+                if self.process.returncode not in (0, -signal.SIGINT):
+                    print(f"⚠️  py-spy failed: {stderr.decode().strip()}")
+                    return
+            elif self.tracker is not None:
+                self.tracker.__exit__(None, None, None)
+            else:
+                return
+            print(f"🔬 {self.tool} capture written to {self.output}")
+        except Exception as e:
+            print(f"⚠️  Could not stop {self.tool}: {e}")
+
+
+def profiler_callbacks(config):
+    """Ultralytics callbacks for the profiler settings in config, empty when it is disabled"""
+    settings = config.get("profiler") or {}
+    if not settings.get("enabled"):
+        return {}
+
+    from ultralytics.utils import RANK
+
+    epochs = []
+    state = {}
+
+    def on_pretrain_routine_end(trainer):
+        # Run after the logger integrations (W&B), so their time lands in logging_s
+        callbacks = trainer.callbacks["on_fit_epoch_end"]
+        callbacks.remove(on_fit_epoch_end)
+        callbacks.append(on_fit_epoch_end)
+
+    def on_train_epoch_start(trainer):
+        now = time.perf_counter()
+        state.update(epoch_start=now, last_batch_end=now, data_s=0.0, compute_s=0.0, batches=0,
+                     val_s=0.0, capture=None, peak_rss_mb=total_rss_mb())
+        if settings.get("capture") and trainer.epoch + 1 == int(settings.get("capture_epoch", 1)) and RANK in {-1, 0}:
+            state["capture"] = EpochCapture(settings["capture"], trainer.save_dir, trainer.epoch + 1)
+            state["capture"].start()
+
+    def on_train_batch_start(trainer):
+        now = time.perf_counter()
+        # Time since the previous step finished is time spent waiting for this batch
+        state["data_s"] += now - state["last_batch_end"]
+        state["batch_start"] = now
+
+    def on_train_batch_end(trainer):
+        now = time.perf_counter()
+        state["compute_s"] += now - state["batch_start"]
+        state["last_batch_end"] = now
+        state["batches"] += 1
+        if state["batches"] % RSS_SAMPLE_INTERVAL == 0:
+            state["peak_rss_mb"] = max(state["peak_rss_mb"], total_rss_mb())
+
+    def on_train_epoch_end(trainer):
+        state["train_end"] = time.perf_counter()
+        state["peak_rss_mb"] = max(state["peak_rss_mb"], total_rss_mb())
+        if state["capture"] is not None:
+            state["capture"].stop()
+
+    def on_val_start(validator):
+        state["val_start"] = time.perf_counter()
+
+    def on_val_end(validator):
+        state["val_s"] = time.perf_counter() - state.get("val_start", time.perf_counter())
+
+    def on_model_save(trainer):
+        state["saved"] = time.perf_counter()
+
+    def on_fit_epoch_end(trainer):
+        if RANK not in {-1, 0}:
+            return
+        now = time.perf_counter()
+        train_s = state["train_end"] - state["epoch_start"]
+        # Every rank trains on its share of the dataset, so this is the global rate
+        images = len(trainer.train_loader.dataset)
+        saved = state.get("saved", state["train_end"])
+        record = {
+            "epoch": trainer.epoch + 1,
+            "images": images,
+            "images_per_s": round(images / train_s, 2) if train_s else 0.0,
+            "train_s": round(train_s, 3),
+            "dataloader_wait_s": round(state["data_s"], 3),
+            "compute_s": round(state["compute_s"], 3),
+            "validation_s": round(state["val_s"], 3),
+            "save_s": round(max(saved - state["train_end"] - state["val_s"], 0.0), 3),
+            # Callbacks that ran after saving, W&B and the other loggers
+            "logging_s": round(now - saved, 3),
+            "epoch_s": round(now - state["epoch_start"], 3),
+            "peak_rss_mb": round(state["peak_rss_mb"], 1),
+        }
+        state.pop("saved", None)
+        epochs.append(record)
+        print(f"⏱️  Epoch {record['epoch']}: {record['images_per_s']} img/s, "
+              f"data wait {record['dataloader_wait_s']:.1f}s, compute {record['compute_s']:.1f}s, "
+              f"validation {record['validation_s']:.1f}s, peak RSS {record['peak_rss_mb']:.0f} MB")
+
+        with open(trainer.save_dir / "profile.json", "w") as f:
+            json.dump({"world_size": int(os.getenv("WORLD_SIZE", 1)), "epochs": epochs}, f, indent=2)
+        try:
+            import wandb
+
+            if wandb.run is not None:
+                wandb.run.log({f"profile/{key}": value for key, value in record.items() if key != "epoch"},
+                              step=record["epoch"])
+        except ImportError:
+            pass
+
+    return {
+        "on_pretrain_routine_end": on_pretrain_routine_end,
+        "on_train_epoch_start": on_train_epoch_start,
+        "on_train_batch_start": on_train_batch_start,
+        "on_train_batch_end": on_train_batch_end,
+        "on_train_epoch_end": on_train_epoch_end,
+        "on_val_start": on_val_start,
+        "on_val_end": on_val_end,
+        "on_model_save": on_model_save,
+        "on_fit_epoch_end": on_fit_epoch_end,
+    }
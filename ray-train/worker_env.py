@@ -0,0 +1,114 @@
+"""
+Cached training environments on Ray nodes
+The Python environment is a virtualenv on top of the node's own packages, built
+once per node for each combination of requirements.txt, system packages and
+Python version, and reused by every later job with the same key
+"""
+
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from disk_cache import materialize_once
+
+DEFAULT_ENV_CACHE_DIR = os.path.join(Path.home(), ".cache", "ml-ops-project", "envs")
+
+# Shared libraries OpenCV needs
+SYSTEM_PACKAGES = ["libgl1-mesa-glx", "libglib2.0-0", "libsm6", "libxext6", "libxrender-dev", "libgomp1"]
+
+
+def environment_key(requirements_file="requirements.txt", system_packages=SYSTEM_PACKAGES):
+    """Hash of everything that goes into a training environment"""
+    digest = hashlib.sha256()
+    with open(requirements_file, "rb") as f:
+        digest.update(f.read())
+    digest.update("\n".join(sorted(system_packages)).encode())
+    return digest.hexdigest()[:16]
+
+
+def missing_system_packages(system_packages=SYSTEM_PACKAGES):
+    """Packages dpkg does not report as installed; without dpkg nothing can be checked or installed"""
+    if shutil.which("dpkg") is None:
+        return []
+    return [
+        package for package in system_packages
+        if subprocess.run(["dpkg", "-s", package], capture_output=True).returncode != 0
+    ]
+
+
+def ensure_system_packages(system_packages=SYSTEM_PACKAGES):
+    """Installs the missing system packages, returns True when nothing had to be installed"""
+    missing = missing_system_packages(system_packages)
+    if not missing:
+        return True
+    if shutil.which("apt") is None:
+        print(f"⚠️  apt not found, cannot install {missing}")
+        return False
+    print(f"🔧 Installing system packages: {missing}")
+    try:
+        subprocess.run(
+            f"sudo apt update && sudo apt install -y {' '.join(missing)}",
+            shell=True, capture_output=True, text=True, check=True
+        )
+    except subprocess.CalledProcessError as e:
+        # OpenCV may still work, training goes on
+        print(f"⚠️  Failed to install system packages: {e}")
+        print(f"   STDERR: {e.stderr}")
+    return False
+
+
+def ensure_python_environment(key, requirements_file="requirements.txt", cache_dir=DEFAULT_ENV_CACHE_DIR):
+    """Returns (python executable, cache hit) for the environment with this key, building it on a miss"""
+    # The key is computed where the job is submitted, the Python version is the node's
+    env_dir = Path(cache_dir) / f"{key}-py{sys.version_info.major}{sys.version_info.minor}"
+    python = str(env_dir / "bin" / "python")
+
+    def build(directory):
+        # System site packages keep the node's Ray (and anything else already
+        # installed at a matching version), pip only adds what is missing
+        subprocess.run([sys.executable, "-m", "venv", "--system-site-packages", str(directory)], check=True)
+        subprocess.run(
+            [python, "-m", "pip", "install", "--index-url", "https://pypi.org/simple/", "-r", requirements_file],
+            capture_output=True, text=True, check=True
+        )
+
+    # Jobs starting together on one node wait for the first build instead of repeating it;
+    # built in place, a virtualenv does not work after being moved
+    return python, materialize_once(env_dir, build, in_place=True)
+
+
+def prepare_environment(requirements_file="requirements.txt"):
+    """Makes sure this node has the training environment; returns (python executable, setup report)"""
+    start = time.perf_counter()
+    key = os.getenv("TRAIN_ENV_KEY") or environment_key(requirements_file)
+    cache_dir = os.getenv("TRAIN_ENV_CACHE_DIR", DEFAULT_ENV_CACHE_DIR)
+
+    system_hit = ensure_system_packages()
+    system_s = time.perf_counter() - start
+    python, python_hit = ensure_python_environment(key, requirements_file, cache_dir)
+
+    report = {
+        "key": key,
+        "system_cache_hit": system_hit,
+        "python_cache_hit": python_hit,
+        "system_s": round(system_s, 2),
+        "python_s": round(time.perf_counter() - start - system_s, 2),
+        "total_s": round(time.perf_counter() - start, 2),
+    }
+    return python, report
+
+
+def exec_in_environment(argv):
+    """Replaces this process with the cached environment's Python running argv, building it first if needed"""
+    python, _ = prepare_environment()
+    os.execv(python, [python, *argv])
+
+
+if __name__ == "__main__":
+    # Entry point of Ray workers started with WORKER_PY_EXECUTABLE:
+    # python worker_env.py <Ray worker arguments>
+    exec_in_environment(sys.argv[1:])
@@ -2,9 +2,18 @@ import argparse
 import os
 import time
 import json
+import random
 import shutil
+import filecmp
+import hashlib
 import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
 
+import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 from tqdm import tqdm
 from label_studio_sdk import Client
@@ -18,6 +27,22 @@ LABEL_STUDIO_URL = ''  # Change to your Label Studio URL
 LABEL_STUDIO_API_KEY = ''  # Replace with your API Key
 LABEL_STUDIO_PROJECT_ID = 1  # Replace with your Project ID
 
+DOWNLOAD_WORKERS = 16
+DOWNLOAD_RETRIES = 5
+DOWNLOAD_MAX_BACKOFF = 30.0  # seconds
+DOWNLOAD_TIMEOUT = 60.0  # seconds per request
+FAILURE_REPORT = 'data/yolo-failed-downloads.json'
+
+OUTPUT_DIR = 'data/yolo'
+# Tasks already exported to OUTPUT_DIR, what an incremental export compares against
+MANIFEST_FILE = 'manifest.json'
+TASK_PAGE_SIZE = 1000
+# Task ids per export request, they are sent as query parameters
+EXPORT_BATCH_SIZE = 200
+
+# Status codes worth retrying, anything else in 4xx will not get better
+RETRY_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] [%(module)s] - %(message)s')
 
@@ -45,7 +70,232 @@ def prepare_export(project):
     return snapshot_path, exported_tasks
 
 
-def run(url: str, api_key: str, project_id: int):
+def resolve_image_url(image_url: str, hostname: str, task_id: int):
+    """(download URL, file name) of a task image, resolved the way label_studio_sdk's get_local_path does"""
+    if image_url.startswith('upload') or image_url.startswith('/upload'):
+        image_url = '/data' + ('' if image_url.startswith('/') else '/') + image_url
+
+    if image_url.startswith('/data/'):
+        # Uploaded files and Local Storage files are served by Label Studio itself
+        if '?d=' in image_url:
+            name = os.path.basename(image_url.split('?d=', 1)[1])
+        else:
+            name = os.path.basename(urlparse(image_url).path)
+        return hostname.rstrip('/') + image_url, name
+
+    if image_url.startswith(('s3:', 'gs:', 'azure-blob:')):
+        # Label Studio redirects to a presigned URL of the bucket
+        presign_url = f"{hostname.rstrip('/')}/tasks/{task_id}/presign/?fileuri={image_url}"
+        return presign_url, os.path.basename(image_url)
+
+    return image_url, os.path.basename(urlparse(image_url).path)
+
+
+def create_session(hostname: str, api_key: str, workers: int):
+    """HTTP session keeping up to `workers` connections per host open, authenticated against Label Studio"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['User-Agent'] = 'Mozilla/5.0 (compatible; ml-ops-project export_yolo)'
+    session.verify = os.getenv('VERIFY_SSL', 'true').lower() not in ('0', 'false', 'no')
+    label_studio_host = urlparse(hostname).netloc
+    token_header = {'Authorization': f'Token {api_key}'}
+
+    def get(url: str, timeout: float):
+        # The token only goes to Label Studio, requests drops it again on redirects to other hosts
+        headers = token_header if urlparse(url).netloc == label_studio_host else None
+        return session.get(url, headers=headers, timeout=timeout)
+
+    return get
+
+
+def file_sha256(path: str):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def download_image(get, task_id: int, url: str, destination_path: str, retries: int, max_backoff: float,
+                   timeout: float):
+    """Downloads url to destination_path; returns (sha256 of the image, None) or (None, failure record)"""
+    error = None
+    for attempt in range(1, retries + 1):
+        try:
+            response = get(url, timeout)
+            if response.status_code not in RETRY_STATUS_CODES:
+                response.raise_for_status()
+                sha256 = hashlib.sha256(response.content).hexdigest()
+                # An unchanged image is left alone, DVC then has nothing to rehash or push
+                if os.path.exists(destination_path) and file_sha256(destination_path) == sha256:
+                    return sha256, None
+                # Written next to the destination and renamed, an interrupted export leaves no partial images
+                tmp_path = f"{destination_path}.{threading.get_ident()}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(response.content)
+                os.replace(tmp_path, destination_path)
+                return sha256, None
+            error = f"HTTP {response.status_code}"
+        except requests.HTTPError as e:
+            # Not found, forbidden and the like: retrying will not help
+            return None, {'task_id': task_id, 'url': url, 'error': str(e), 'attempts': attempt}
+        except (requests.RequestException, OSError) as e:
+            error = str(e)
+
+        if attempt < retries:
+            # Capped exponential backoff with full jitter, so the workers do not retry in lockstep
+            sleep_time = random.uniform(0, min(max_backoff, 2 ** (attempt - 1)))
+            logger.debug(f"Retrying task {task_id} in {sleep_time:.1f} seconds ({error}, attempt {attempt}/{retries})")
+            time.sleep(sleep_time)
+    return None, {'task_id': task_id, 'url': url, 'error': error, 'attempts': retries}
+
+
+def download_images(tasks, hostname: str, api_key: str, images_dir: str, workers: int = DOWNLOAD_WORKERS,
+                    retries: int = DOWNLOAD_RETRIES, max_backoff: float = DOWNLOAD_MAX_BACKOFF,
+                    timeout: float = DOWNLOAD_TIMEOUT):
+    """Downloads the image of every task into images_dir with `workers` parallel requests
+
+    Returns ({task id: sha256 of its image}, failures)
+    """
+    get = create_session(hostname, api_key, workers)
+    hashes = {}
+    failures = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for task in tasks:
+            image_url = next(iter(task['data'].values()), None)
+            if not image_url:
+                logger.warning(f"No image URL found for task {task['id']}")
+                failures.append({'task_id': task['id'], 'url': None, 'error': 'No image URL', 'attempts': 0})
+                continue
+            download_url, name = resolve_image_url(image_url, hostname, task['id'])
+            future = executor.submit(download_image, get, task['id'], download_url,
+                                     os.path.join(images_dir, name), retries, max_backoff, timeout)
+            futures[future] = task['id']
+
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            try:
+                sha256, failure = future.result()
+            except Exception as e:
+                sha256, failure = None, {'task_id': futures[future], 'url': None, 'error': str(e), 'attempts': 0}
+            if failure:
+                logger.error(f"Failed to download image for task {failure['task_id']}: {failure['error']}")
+                failures.append(failure)
+            else:
+                hashes[futures[future]] = sha256
+    return hashes, sorted(failures, key=lambda failure: failure['task_id'])
+
+
+def write_failure_report(failures, report_path: str):
+    """Writes the failed downloads to report_path, removes a stale report when there are none"""
+    if not failures:
+        if os.path.exists(report_path):
+            os.remove(report_path)
+        return
+    os.makedirs(os.path.dirname(report_path) or '.', exist_ok=True)
+    with open(report_path, 'w') as f:
+        json.dump(failures, f, indent=2)
+    logger.error(f"{len(failures)} image downloads failed, see {report_path}")
+
+
+def task_version(task):
+    """(latest update time, version hash) of a task, the hash changes with its data and with any annotation"""
+    annotations = sorted(
+        (annotation.get('id'), annotation.get('updated_at') or '') for annotation in task.get('annotations') or []
+    )
+    updated_at = max([task.get('updated_at') or ''] + [updated for _, updated in annotations])
+    version = hashlib.sha256(
+        json.dumps([task.get('data'), task.get('updated_at'), annotations], sort_keys=True, default=str).encode()
+    ).hexdigest()[:16]
+    return updated_at, version
+
+
+def list_task_versions(project, page_size: int = TASK_PAGE_SIZE):
+    """{task id: (latest update time, version hash)} of every task in the project"""
+    versions = {}
+    page = 1
+    while True:
+        # Unresolved URIs, presigned ones would change the version on every run
+        data = project.get_paginated_tasks(page=page, page_size=page_size, resolve_uri=False)
+        for task in data['tasks']:
+            versions[task['id']] = task_version(task)
+        if data.get('end_pagination') or len(data['tasks']) < page_size:
+            return versions
+        page += 1
+
+
+def export_tasks_by_id(project, task_ids, export_path: str, batch_size: int = EXPORT_BATCH_SIZE):
+    """Exports only the given tasks to a JSON file, without creating a snapshot of the whole project"""
+    tasks = []
+    for first in range(0, len(task_ids), batch_size):
+        tasks += project.export_tasks(export_type='JSON', download_all_tasks=True,
+                                      ids=task_ids[first:first + batch_size])
+    with open(export_path, 'w') as f:
+        json.dump(tasks, f)
+    return tasks
+
+
+def load_manifest(output_dir: str):
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        manifest = json.load(f)
+    # JSON object keys are strings
+    manifest['tasks'] = {int(task_id): entry for task_id, entry in manifest['tasks'].items()}
+    return manifest
+
+
+def save_manifest(manifest, output_dir: str):
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    tasks = {str(task_id): manifest['tasks'][task_id] for task_id in sorted(manifest['tasks'])}
+    with open(f"{path}.tmp", 'w') as f:
+        json.dump({**manifest, 'tasks': tasks}, f, indent=1, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
+
+
+def label_file_name(converter, task, images_dir: str):
+    """Name of the label file Converter.convert_to_yolo writes for a task, derived from its image path the same way"""
+    image_url = next(iter(task['data'].values()), None)
+    if not image_url:
+        return None
+    image_path = image_url
+    if not os.path.exists(image_url):
+        try:
+            image_path = get_local_path(
+                url=image_url,
+                hostname=converter.hostname,
+                project_dir=converter.project_dir,
+                image_dir=converter.upload_dir,
+                cache_dir=images_dir,
+                download_resources=False,
+                access_token=converter.access_token,
+                task_id=task['id'],
+            )
+        except Exception:
+            # The converter keeps the URL itself when it cannot be resolved
+            pass
+    return os.path.splitext(os.path.basename(image_path))[0][:255 - 4] + '.txt'
+
+
+def replace_if_changed(source: str, destination: str):
+    """Moves source over destination unless both have the same content, returns whether destination changed"""
+    if os.path.exists(destination) and filecmp.cmp(source, destination, shallow=False):
+        return False
+    os.replace(source, destination)
+    return True
+
+
+def remove_file(path: str):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def run(url: str, api_key: str, project_id: int, workers: int = DOWNLOAD_WORKERS,
+        retries: int = DOWNLOAD_RETRIES, max_backoff: float = DOWNLOAD_MAX_BACKOFF,
+        failure_report: str = FAILURE_REPORT, incremental: bool = False, output_dir: str = OUTPUT_DIR):
     logger.info("Connecting to Label Studio.")
     ls = Client(url=url, api_key=api_key)
     ls.check_connection()
@@ -53,54 +303,117 @@ def run(url: str, api_key: str, project_id: int):
 
     logger.info(f"Retrieving project with ID: {project_id}.")
     project = ls.get_project(project_id)
+    label_config = project.params['label_config']
+    label_config_hash = hashlib.sha256(label_config.encode()).hexdigest()
 
-    logger.info("Downloading export snapshot and loading exported tasks.")
-    snapshot_path, exported_tasks = prepare_export(project)
+    logger.info("Listing project tasks.")
+    versions = list_task_versions(project)
+    manifest = load_manifest(output_dir)
+    if incremental and manifest is None:
+        logger.info("No manifest found, running a full export.")
+        incremental = False
+    elif incremental and (manifest['project_id'] != project_id or manifest['label_config'] != label_config_hash):
+        # Class ids follow the labeling config, every label file may have changed
+        logger.info("Project or labeling config changed since the last export, running a full export.")
+        incremental = False
+    previous = manifest['tasks'] if manifest and manifest['project_id'] == project_id else {}
 
-    logger.info("Initializing Converter with labeling config.")
-    label_config = project.params['label_config']
-    converter = Converter(config=label_config, project_dir=os.path.dirname(snapshot_path), download_resources=False)
-
-    logger.info("Converting to YOLO format.")
-    output_dir = 'data/yolo'
-    converter.convert_to_yolo(input_data=snapshot_path, output_dir=output_dir, is_dir=False)
-
-    logger.info("Creating directory for YOLO images.")
-    yolo_images_dir = os.path.join(output_dir, 'images')
-    os.makedirs(yolo_images_dir, exist_ok=True)
-
-    logger.info("Downloading images for exported tasks.")
-    for task in tqdm(exported_tasks):
-        image_url = next(iter(task['data'].values()))
-        if image_url:
-            max_retries = 100
-            retry_delay = 1  # initial delay in seconds
-            for attempt in range(1, max_retries + 1):
-                try:
-                    local_image_path = get_local_path(
-                        url=image_url,
-                        hostname=url,
-                        access_token=api_key,
-                        task_id=task['id'],
-                        download_resources=True
-                    )
-                    name = os.path.basename(local_image_path).split('__', 1)[-1]
-                    destination_path = os.path.join(yolo_images_dir, name)
-                    shutil.copy2(local_image_path, destination_path)
-                    logger.info(f"Copied image {local_image_path} to {destination_path}")
-                    break  # Break the retry loop if download is successful
-                except Exception as e:
-                    logger.error(f"Error downloading image for task {task['id']}: {e}")
-                    if attempt < max_retries:
-                        sleep_time = retry_delay * (2 ** (attempt - 1))  # Exponential backoff
-                        logger.info(f"Retrying in {sleep_time} seconds... (Attempt {attempt}/{max_retries})")
-                        time.sleep(sleep_time)
-                    else:
-                        logger.error(f"Failed to download image for task {task['id']} after {max_retries} attempts.")
+    staging_dir = tempfile.mkdtemp(prefix='yolo-export-')
+    try:
+        if incremental:
+            changed_ids = sorted(
+                task_id for task_id, (_, version) in versions.items()
+                if previous.get(task_id, {}).get('version') != version
+            )
+            logger.info(f"{len(changed_ids)} new or changed tasks, "
+                        f"{len(set(previous) - set(versions))} removed tasks since the last export.")
+            export_path = os.path.join(staging_dir, 'tasks.json')
+            exported_tasks = export_tasks_by_id(project, changed_ids, export_path)
+            project_dir = staging_dir
         else:
-            logger.warning(f"No image URL found for task {task['id']}")
-    logger.info("YOLO export with images completed successfully.")
+            logger.info("Downloading export snapshot and loading exported tasks.")
+            export_path, exported_tasks = prepare_export(project)
+            project_dir = os.path.dirname(export_path)
+
+        logger.info("Initializing Converter with labeling config.")
+        converter = Converter(config=label_config, project_dir=project_dir, download_resources=False)
+
+        logger.info(f"Converting {len(exported_tasks)} tasks to YOLO format.")
+        converted_dir = os.path.join(staging_dir, 'yolo')
+        converter.convert_to_yolo(input_data=export_path, output_dir=converted_dir, is_dir=False)
+
+        logger.info("Merging converted labels into the YOLO dataset.")
+        yolo_images_dir = os.path.join(output_dir, 'images')
+        yolo_labels_dir = os.path.join(output_dir, 'labels')
+        os.makedirs(yolo_images_dir, exist_ok=True)
+        os.makedirs(yolo_labels_dir, exist_ok=True)
+        for name in ('classes.txt', 'notes.json'):
+            if os.path.exists(os.path.join(converted_dir, name)):
+                replace_if_changed(os.path.join(converted_dir, name), os.path.join(output_dir, name))
+
+        tasks = {}
+        changed_labels = 0
+        for task in exported_tasks:
+            label = label_file_name(converter, task, os.path.join(converted_dir, 'images'))
+            converted_label = label and os.path.join(converted_dir, 'labels', label)
+            if converted_label and os.path.exists(converted_label):
+                changed_labels += replace_if_changed(converted_label, os.path.join(yolo_labels_dir, label))
+            else:
+                # Only skipped or cancelled annotations: the converter writes no label file
+                label = None
+            image_url = next(iter(task['data'].values()), None)
+            updated_at, version = versions.get(task['id'], (None, None))
+            tasks[task['id']] = {
+                'updated_at': updated_at,
+                'version': version,
+                'image_url': image_url,
+                'image': image_url and resolve_image_url(image_url, url, task['id'])[1],
+                'label': label,
+            }
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+    # Images still on disk with the content recorded for the same URL are not downloaded again
+    to_download = []
+    for task in exported_tasks:
+        entry, old = tasks[task['id']], previous.get(task['id'], {})
+        image_path = entry['image'] and os.path.join(yolo_images_dir, entry['image'])
+        if (incremental and entry['image_url'] == old.get('image_url') and old.get('image_sha256')
+                and os.path.exists(image_path) and file_sha256(image_path) == old['image_sha256']):
+            entry['image_sha256'] = old['image_sha256']
+        else:
+            to_download.append(task)
+
+    logger.info(f"Downloading images for {len(to_download)} exported tasks with {workers} workers.")
+    start = time.perf_counter()
+    hashes, failures = download_images(to_download, url, api_key, yolo_images_dir, workers, retries, max_backoff)
+    write_failure_report(failures, failure_report)
+    logger.info(f"Downloaded {len(hashes)}/{len(to_download)} images in {time.perf_counter() - start:.1f} seconds.")
 
+    failed_ids = {failure['task_id'] for failure in failures}
+    for task_id, sha256 in hashes.items():
+        tasks[task_id]['image_sha256'] = sha256
+    # Failed tasks keep their previous entry (or none), the next incremental export retries them
+    current = {task_id: entry for task_id, entry in previous.items() if task_id in versions}
+    current.update({task_id: entry for task_id, entry in tasks.items() if task_id not in failed_ids})
+
+    # Files of removed tasks, and files a changed task no longer uses, unless another task still does
+    images_in_use = {entry['image'] for entry in current.values()} | {entry['image'] for entry in tasks.values()}
+    labels_in_use = {entry['label'] for entry in current.values()} | {entry['label'] for entry in tasks.values()}
+    removed = 0
+    for entry in previous.values():
+        if entry.get('image') and entry['image'] not in images_in_use:
+            remove_file(os.path.join(yolo_images_dir, entry['image']))
+            removed += 1
+        if entry.get('label') and entry['label'] not in labels_in_use:
+            remove_file(os.path.join(yolo_labels_dir, entry['label']))
+    logger.info(f"{changed_labels} label files updated, {removed} images of removed tasks deleted.")
+
+    save_manifest({'project_id': project_id, 'label_config': label_config_hash, 'tasks': current}, output_dir)
+    if failures:
+        return False
+
+    logger.info("YOLO export with images completed successfully.")
     return True
 
 def parse_arguments():
@@ -125,9 +438,41 @@ def parse_arguments():
         default=int(os.getenv('PROJECT_ID', LABEL_STUDIO_PROJECT_ID)),
         help='Label Studio Project ID',
     )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=int(os.getenv('EXPORT_DOWNLOAD_WORKERS', DOWNLOAD_WORKERS)),
+        help='Number of parallel image downloads',
+    )
+    parser.add_argument(
+        '--retries',
+        type=int,
+        default=int(os.getenv('EXPORT_DOWNLOAD_RETRIES', DOWNLOAD_RETRIES)),
+        help='Attempts per image before it is reported as failed',
+    )
+    parser.add_argument(
+        '--max-backoff',
+        type=float,
+        default=float(os.getenv('EXPORT_DOWNLOAD_MAX_BACKOFF', DOWNLOAD_MAX_BACKOFF)),
+        help='Upper bound in seconds for the wait between two attempts',
+    )
+    parser.add_argument(
+        '--failure-report',
+        type=str,
+        default=FAILURE_REPORT,
+        help='JSON file listing the tasks whose image could not be downloaded',
+    )
+    parser.add_argument(
+        '--incremental',
+        action='store_true',
+        default=os.getenv('EXPORT_INCREMENTAL', 'false').lower() in ('1', 'true', 'yes'),
+        help=f'Export only tasks that are new or changed since the last export (tracked in {OUTPUT_DIR}/{MANIFEST_FILE})',
+    )
     return parser.parse_args()
 
 
 if __name__ == "__main__":
     args = parse_arguments()
-    run(args.url, args.api_key, args.project_id)
\ No newline at end of file
+    success = run(args.url, args.api_key, args.project_id, args.workers, args.retries, args.max_backoff,
+                  args.failure_report, args.incremental)
+    raise SystemExit(0 if success else 1)
@@ -0,0 +1,11 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The component directories are flat module trees, imported the way their scripts do
+for component in ("ray-deploy", "ray-train"):
+    sys.path.insert(0, os.path.join(ROOT, component))
+
+# test.py is a manual script against a running deployment, not a test module
+collect_ignore = ["test.py"]
@@ -2,8 +2,12 @@ import cv2
 import numpy as np
 import requests
 import os
+import sys
 from dotenv import load_dotenv
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "client"))
+from detect_client import DetectClient
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -25,10 +29,11 @@ resp = requests.get(image_url)
 image_nparray = np.asarray(bytearray(resp.content), dtype=np.uint8)
 image = cv2.imdecode(image_nparray, cv2.IMREAD_COLOR)
 
-# Send request to the object detection server
-resp = requests.get(f"{server_url}detect?image_url={image_url}", headers={"Authorization": api_key})
+# Upload the downloaded bytes, so the server does not fetch the image a second time
+with DetectClient(server_url, api_key=api_key) as client:
+    result = client.detect(resp.content)
 
-detections = resp.json()["objects"]
+detections = result.get("objects", [])
 
 # Draw bounding boxes and labels for each detected object
 for item in detections:
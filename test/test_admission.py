@@ -0,0 +1,52 @@
+import time
+
+import pytest
+
+from admission import AdmissionController, DeadlineExceededError, OverloadedError, autoscaling_config
+
+
+def test_full_queue_is_rejected():
+    admission = AdmissionController(max_queue_depth=4, max_batch_size=2)
+    admission.admit(3, None)
+    with pytest.raises(OverloadedError):
+        admission.admit(4, None)
+
+
+def test_unbounded_queue():
+    AdmissionController(max_queue_depth=0, max_batch_size=2).admit(1000, None)
+
+
+def test_deadline_that_cannot_be_met_is_rejected():
+    admission = AdmissionController(max_queue_depth=0, max_batch_size=2)
+    admission.observe_batch_latency(0.1)
+    # Two batches ahead plus its own: about 300ms
+    assert admission.estimated_wait_s(4) == pytest.approx(0.3)
+    admission.admit(4, time.time() + 1)
+    with pytest.raises(DeadlineExceededError):
+        admission.admit(4, time.time() + 0.2)
+    with pytest.raises(DeadlineExceededError):
+        admission.check_deadline(time.time() - 1)
+
+
+def test_deadline_can_be_a_callable():
+    admission = AdmissionController(max_queue_depth=0, max_batch_size=2)
+    admission.check_deadline(lambda: None)
+    with pytest.raises(DeadlineExceededError):
+        admission.check_deadline(lambda: time.time() - 1)
+
+
+def test_batch_latency_is_smoothed():
+    admission = AdmissionController(max_queue_depth=0, max_batch_size=2, smoothing=0.5)
+    admission.observe_batch_latency(0.1)
+    admission.observe_batch_latency(0.3)
+    assert admission.batch_latency_s == pytest.approx(0.2)
+
+
+def test_autoscaling_target_from_latency_budget(monkeypatch):
+    monkeypatch.delenv("DETECT_TARGET_ONGOING_REQUESTS", raising=False)
+    monkeypatch.setenv("DETECT_MAX_BATCH_SIZE", "8")
+    monkeypatch.setenv("DETECT_LATENCY_TARGET_MS", "200")
+    monkeypatch.setenv("DETECT_BATCH_LATENCY_MS", "50")
+    assert autoscaling_config()["target_ongoing_requests"] == 32
+    monkeypatch.setenv("DETECT_BATCH_LATENCY_MS", "")
+    assert autoscaling_config()["target_ongoing_requests"] == 8
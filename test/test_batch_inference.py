@@ -0,0 +1,14 @@
+from batch_inference import BLOCKS_PER_WORKER, input_blocks
+
+
+def test_blocks_follow_the_worker_pool():
+    assert input_blocks(100_000, 16, 100_000, workers=8) == 8 * BLOCKS_PER_WORKER
+
+
+def test_blocks_never_span_more_than_a_chunk():
+    assert input_blocks(1_000_000, 16, 10_000, workers=2) == 100
+
+
+def test_blocks_hold_at_least_a_batch():
+    assert input_blocks(40, 16, 10_000, workers=8) == 2
+    assert input_blocks(5, 16, 10_000, workers=8) == 1
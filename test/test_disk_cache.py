@@ -0,0 +1,53 @@
+import os
+
+import pytest
+
+from disk_cache import COMPLETE_MARKER, materialize_once
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_builds_once(tmp_path):
+    builds = []
+
+    def build(directory):
+        builds.append(directory)
+        (directory / "data.txt").write_text("built")
+
+    entry = tmp_path / "entry"
+    assert materialize_once(entry, build) is False
+    assert materialize_once(entry, build) is True
+    assert len(builds) == 1
+    assert (entry / "data.txt").read_text() == "built"
+    assert (entry / COMPLETE_MARKER).exists()
+    assert not (tmp_path / "entry.tmp").exists()
+
+
+def test_failed_build_is_redone(tmp_path):
+    entry = tmp_path / "entry"
+
+    def fail(directory):
+        (directory / "partial.txt").write_text("partial")
+        raise RuntimeError("download failed")
+
+    with pytest.raises(RuntimeError):
+        materialize_once(entry, fail)
+    assert not entry.exists() and not (tmp_path / "entry.tmp").exists()
+
+    assert materialize_once(entry, lambda directory: (directory / "data.txt").write_text("built")) is False
+    assert sorted(os.listdir(entry)) == [COMPLETE_MARKER, "data.txt"]
+
+
+def test_in_place_build(tmp_path):
+    entry = tmp_path / "env"
+    seen = []
+    materialize_once(entry, seen.append, in_place=True)
+    assert seen == [entry]
+    assert (entry / COMPLETE_MARKER).exists()
+
+
+def test_components_share_one_helper():
+    # ray-train and ray-deploy are shipped as separate working dirs, each with a copy
+    with open(os.path.join(ROOT, "ray-train", "disk_cache.py")) as train, \
+            open(os.path.join(ROOT, "ray-deploy", "disk_cache.py")) as deploy:
+        assert train.read() == deploy.read()
@@ -0,0 +1,58 @@
+import cv2
+import numpy as np
+import pytest
+import torch
+
+from backends import PRECISIONS, InferenceBackend, _box_iou, load_backend
+from preprocessing import decode_image, letterbox, prepare_image, scale_boxes
+
+
+def test_letterbox_keeps_aspect_ratio():
+    image = np.full((100, 200, 3), 255, dtype=np.uint8)
+    prepared = letterbox(image, 64)
+    assert prepared.tensor.shape == (3, 64, 64)
+    assert prepared.scale == pytest.approx(0.32)
+    assert prepared.pad == (0, 16)
+    assert prepared.shape == (100, 200)
+    # Padding rows hold the Ultralytics pad color, the image itself is white
+    assert prepared.tensor[0, 0, 0] == pytest.approx(114 / 255)
+    assert prepared.tensor[0, 32, 32] == pytest.approx(1.0)
+
+
+def test_scale_boxes_maps_back_and_clips():
+    prepared = letterbox(np.zeros((100, 200, 3), dtype=np.uint8), 64)
+    boxes = np.array([[0, 16, 32, 32], [-10, 0, 80, 64]], dtype=np.float32)
+    np.testing.assert_allclose(scale_boxes(boxes, prepared), [[0, 0, 100, 50], [0, 0, 200, 100]])
+
+
+def test_decode_image_roundtrip_and_errors():
+    ok, encoded = cv2.imencode(".png", np.zeros((20, 30, 3), dtype=np.uint8))
+    assert decode_image(encoded.tobytes()).shape == (20, 30, 3)
+    assert prepare_image(encoded.tobytes(), 32).shape == (20, 30)
+    with pytest.raises(ValueError):
+        decode_image(b"not an image")
+
+
+def test_box_iou():
+    boxes = np.array([[0, 0, 10, 10], [5, 0, 15, 10]], dtype=np.float32)
+    np.testing.assert_allclose(_box_iou(boxes, boxes), [[1, 1 / 3], [1 / 3, 1]], atol=1e-6)
+
+
+def test_unsupported_backend_or_precision():
+    with pytest.raises(ValueError):
+        load_backend("model.pt", "v1", backend="tensorrt")
+    with pytest.raises(ValueError):
+        load_backend("model.pt", "v1", backend="onnx", precision="fp16")
+    assert "int8" in PRECISIONS["openvino"]
+
+
+def test_static_batch_is_padded_and_trimmed():
+    sizes = []
+
+    def model(batch, **kwargs):
+        sizes.append(batch.shape[0])
+        return list(range(batch.shape[0]))
+
+    backend = InferenceBackend(model, "torchscript", "fp32", imgsz=32, static_batch=4)
+    assert backend.predict(torch.zeros((2, 3, 32, 32))) == [0, 1]
+    assert sizes == [4]
@@ -0,0 +1,91 @@
+import asyncio
+import time
+
+import pytest
+
+from admission import DeadlineExceededError, resolve_deadline
+from result_cache import ResultCache
+
+
+def test_concurrent_callers_share_one_computation():
+    calls = []
+
+    async def compute(deadline):
+        calls.append(deadline)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def main():
+        cache = ResultCache()
+        results = await asyncio.gather(*(cache.get_or_compute("image", compute) for _ in range(3)))
+        return cache, results
+
+    cache, results = asyncio.run(main())
+    assert results == ["result"] * 3
+    assert len(calls) == 1
+    assert (cache.misses, cache.coalesced) == (1, 2)
+    # Stored once finished, the next caller is a hit
+    assert asyncio.run(cache.get_or_compute("image", compute)) == "result"
+    assert cache.hits == 1
+
+
+def test_each_caller_waits_within_its_own_deadline():
+    seen = []
+
+    async def compute(deadline):
+        await asyncio.sleep(0.2)
+        seen.append(resolve_deadline(deadline))
+        return "result"
+
+    async def main():
+        cache = ResultCache()
+        now = time.time()
+        short = cache.get_or_compute("image", compute, now + 0.05)
+        long = cache.get_or_compute("image", compute, now + 5)
+        return await asyncio.gather(short, long, return_exceptions=True), now
+
+    (short, long), now = asyncio.run(main())
+    assert isinstance(short, DeadlineExceededError)
+    assert long == "result"
+    # The shared computation ran under the deadline of the caller still waiting
+    assert seen == [pytest.approx(now + 5)]
+
+
+def test_deadline_failure_is_not_shared_with_later_deadlines():
+    calls = []
+
+    async def compute(deadline):
+        calls.append(resolve_deadline(deadline))
+        await asyncio.sleep(0.02)
+        if len(calls) == 1:
+            raise DeadlineExceededError("too late")
+        return "result"
+
+    async def main():
+        cache = ResultCache()
+        now = time.time()
+
+        async def later_caller():
+            # Joins after the shared computation checked the first caller's deadline
+            await asyncio.sleep(0.005)
+            return await cache.get_or_compute("image", compute, now + 5)
+
+        first = cache.get_or_compute("image", compute, now + 1)
+        return await asyncio.gather(first, later_caller(), return_exceptions=True), now
+
+    (first, second), now = asyncio.run(main())
+    assert isinstance(first, DeadlineExceededError)
+    # The caller with more time starts the computation over instead of failing with the first
+    assert second == "result"
+    assert calls == [pytest.approx(now + 1), pytest.approx(now + 5)]
+
+
+def test_model_change_invalidates_results():
+    async def compute(deadline):
+        return "old"
+
+    cache = ResultCache(model_version="v1")
+    asyncio.run(cache.get_or_compute("image", compute))
+    cache.set_model_version("v2")
+    assert cache.stats()["entries"] == 0
+    assert cache.invalidations == 1
@@ -0,0 +1,57 @@
+import json
+
+import numpy as np
+import pytest
+
+from shard_cache import INDEX_FILE, sharded_dataset_class, shard_files
+
+
+def write_shard_index(shard_dir, im_files, corrupt_files=()):
+    with open(shard_dir / INDEX_FILE, "w") as f:
+        json.dump({"im_files": im_files, "corrupt_files": list(corrupt_files), "imgsz": 32, "shard_size": 4,
+                   "channels": 3}, f)
+    np.save(shard_dir / "shapes.npy", np.full((len(im_files), 4), 32, dtype=np.int32))
+    np.save(shard_dir / "labels.npy", np.zeros((len(im_files), 5), dtype=np.float32))
+    np.save(shard_dir / "label_offsets.npy", np.arange(len(im_files) + 1, dtype=np.int64))
+
+
+def stale_dataset(shard_dir, im_files):
+    # Only the state get_labels reads, without building a full YOLODataset
+    dataset = sharded_dataset_class().__new__(sharded_dataset_class())
+    with open(shard_dir / INDEX_FILE, "r") as f:
+        index = json.load(f)
+    dataset.shard_dir = shard_dir
+    dataset.positions = {file: i for i, file in enumerate(index["im_files"])}
+    dataset.corrupt_files = set(index["corrupt_files"])
+    dataset.shard_shapes = np.load(shard_dir / "shapes.npy")
+    dataset.im_files = im_files
+    return dataset
+
+
+def test_shard_files_keeps_indexed_images_in_order():
+    assert shard_files(["b.jpg", "a.jpg"], {"a.jpg": 0, "b.jpg": 1}, set()) == ["b.jpg", "a.jpg"]
+
+
+def test_shard_files_skips_images_dropped_as_corrupt():
+    assert shard_files(["a.jpg", "bad.jpg"], {"a.jpg": 0}, {"bad.jpg"}) == ["a.jpg"]
+
+
+def test_shard_files_names_missing_images():
+    with pytest.raises(FileNotFoundError, match="new.jpg"):
+        shard_files(["a.jpg", "new.jpg"], {"a.jpg": 0}, set())
+
+
+def test_stale_shard_index_fails_loudly(tmp_path):
+    write_shard_index(tmp_path, ["a.jpg", "b.jpg"])
+    dataset = stale_dataset(tmp_path, ["a.jpg", "b.jpg", "c.jpg"])
+    with pytest.raises(FileNotFoundError, match="c.jpg"):
+        dataset.get_labels()
+
+
+def test_labels_come_from_the_shard_index(tmp_path):
+    write_shard_index(tmp_path, ["a.jpg", "b.jpg"], corrupt_files=["bad.jpg"])
+    dataset = stale_dataset(tmp_path, ["b.jpg", "bad.jpg"])
+    labels = dataset.get_labels()
+    assert dataset.im_files == ["b.jpg"]
+    assert [label["im_file"] for label in labels] == ["b.jpg"]
+    assert labels[0]["shape"] == (32, 32)
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from tiling import TileConfig, check_tile_config, make_tiles, merge_tiles, tile_origins
+
+
+def test_tile_origins_cover_the_far_edge():
+    assert tile_origins(500, 640, 0.2) == [0]
+    assert tile_origins(1000, 400, 0.5) == [0, 200, 400, 600]
+
+
+def test_invalid_tile_config():
+    with pytest.raises(ValueError):
+        check_tile_config(16, 0.2)
+    with pytest.raises(ValueError):
+        check_tile_config(256, 1.0)
+
+
+def test_make_tiles_adds_a_whole_image_view():
+    image = np.zeros((300, 500, 3), dtype=np.uint8)
+    tiles = make_tiles(image, TileConfig(256, 0.0), imgsz=64, max_tiles=16)
+    assert [tile.offset for tile in tiles] == [(0, 0), (0, 0), (244, 0), (0, 44), (244, 44)]
+    assert all(tile.image.tensor.shape == (3, 64, 64) for tile in tiles)
+    with pytest.raises(ValueError):
+        make_tiles(image, TileConfig(256, 0.0), imgsz=64, max_tiles=3)
+
+
+def test_merge_tiles_shifts_boxes_and_removes_duplicates():
+    image = np.zeros((300, 500, 3), dtype=np.uint8)
+    tiles = make_tiles(image, TileConfig(256, 0.0), imgsz=64, max_tiles=16)
+    detections = [np.zeros((0, 6), dtype=np.float32) for _ in tiles]
+    # The same object seen by two overlapping tiles, and another class at the same place
+    detections[1] = np.array([[250, 10, 256, 20, 0.9, 0], [250, 10, 256, 20, 0.8, 1]], dtype=np.float32)
+    detections[2] = np.array([[6, 10, 12, 20, 0.7, 0]], dtype=np.float32)
+
+    merged = merge_tiles(detections, tiles, iou_threshold=0.5)
+    np.testing.assert_allclose(merged, [[250, 10, 256, 20, 0.9, 0], [250, 10, 256, 20, 0.8, 1]])
+
+
+def test_merge_tiles_without_detections():
+    assert merge_tiles([np.zeros((0, 6), dtype=np.float32)], [None], 0.5).shape == (0, 6)